@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ObjectCache:
+    """Byte-budgeted LRU of small objects, keyed by name.
+
+    Entries are served without touching storage for `ttl` seconds; after that the
+    caller revalidates them against the backend's ETag/generation via `refresh`.
+    Thread-safe, since sync FastAPI handlers run on a thread pool.
+    """
+
+    def __init__(self, max_bytes, max_object_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self.ttl = ttl
+        self.entries = OrderedDict()  # name -> (data, info, expires_at)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.revalidations = self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, name):
+        """Returns (data, info, fresh) for a cached object, or None on a miss."""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+            data, info, expires_at = entry
+            fresh = time.monotonic() < expires_at
+            if fresh:
+                self.hits += 1
+            return data, info, fresh
+
+    def refresh(self, name, info):
+        """Extends a stale entry if `info` still matches it; otherwise drops it."""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and info is not None and entry[1].etag == info.etag:
+                self.entries[name] = (entry[0], entry[1], time.monotonic() + self.ttl)
+                self.revalidations += 1
+                return True
+            self._remove(name)
+            self.misses += 1
+            return False
+
+    def admits(self, size):
+        return self.enabled and size <= self.max_object_bytes
+
+    def put(self, name, data, info):
+        if not self.admits(len(data)):
+            return
+        with self.lock:
+            self._remove(name)
+            self.entries[name] = (data, info, time.monotonic() + self.ttl)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (evicted, _, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, name):
+        with self.lock:
+            self._remove(name)
+
+    def _remove(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.revalidations + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.revalidations) / lookups if lookups else None,
+                "objects": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "max_object_bytes": self.max_object_bytes,
+                "ttl_sec": self.ttl,
+            }
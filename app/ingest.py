@@ -0,0 +1,95 @@
+import asyncio
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _collect(events):
+    def on_data(kind):
+        return lambda data, start, end: events.append((kind, data[start:end]))
+
+    def on_mark(kind):
+        return lambda: events.append((kind, b""))
+
+    return {
+        "on_part_begin": on_mark("part_begin"),
+        "on_part_data": on_data("part_data"),
+        "on_part_end": on_mark("part_end"),
+        "on_header_field": on_data("header_field"),
+        "on_header_value": on_data("header_value"),
+        "on_header_end": on_mark("header_end"),
+        "on_headers_finished": on_mark("headers_finished"),
+    }
+
+
+async def stream_multipart(request, storage, pool, chunk_size, max_bytes, field="file"):
+    """Writes every file part named `field` to storage while the body is still arriving.
+
+    Part data is buffered up to `chunk_size` and handed to the part's storage writer on
+    `pool`; the next body chunk is only read once that write returns, so memory per
+    upload stays around one chunk. Returns the stored file names in body order.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("expected multipart/form-data with a boundary")
+
+    loop = asyncio.get_running_loop()
+    events = []
+    parser = MultipartParser(boundary, _collect(events))
+    names = []
+    headers = {}
+    header_field = header_value = b""
+    writer = None
+    buffer = bytearray()
+    received = 0
+
+    async def flush():
+        if buffer:
+            await loop.run_in_executor(pool, writer.write, bytes(buffer))
+            buffer.clear()
+
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise BodyTooLarge(f"request body exceeds {max_bytes} bytes")
+            parser.write(chunk)
+            for kind, data in events:
+                if kind == "part_begin":
+                    headers = {}
+                elif kind == "header_field":
+                    header_field += data
+                elif kind == "header_value":
+                    header_value += data
+                elif kind == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field = header_value = b""
+                elif kind == "headers_finished":
+                    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+                    filename = options.get(b"filename")
+                    if options.get(b"name") == field.encode() and filename:
+                        name = filename.decode("latin-1")
+                        part_type = headers.get(b"content-type", b"").decode("latin-1") or None
+                        writer = await loop.run_in_executor(pool, storage.open_writer, name, part_type, chunk_size)
+                        names.append(name)
+                elif kind == "part_data" and writer is not None:
+                    buffer += data
+                    if len(buffer) >= chunk_size:
+                        await flush()
+                elif kind == "part_end" and writer is not None:
+                    await flush()
+                    await loop.run_in_executor(pool, writer.commit)
+                    writer = None
+            events.clear()
+        parser.finalize()
+        if writer is not None:
+            # The body ended inside a file part (no closing boundary)
+            raise ValueError("multipart body ended before the end of a file part")
+    except BaseException:
+        if writer is not None:
+            await loop.run_in_executor(pool, writer.discard)
+        raise
+    return names
@@ -1,31 +1,209 @@
+import asyncio
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from starlette.responses import StreamingResponse
-from google.cloud import storage
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from cache import ObjectCache
+from ingest import BodyTooLarge, stream_multipart
+from metrics import ContextThreadPoolExecutor, InstrumentedStorage, Metrics
+from middleware import EchoClientHeaders, RequestMetrics
+from ranges import RangeNotSatisfiable, etag_matches, etag_matches_strong, parse_range, quote_etag
+from storage import get_storage
 
-BUCKET = os.getenv("BUCKET_NAME")
-if not BUCKET:
-    raise RuntimeError("BUCKET_NAME env var is required")
+# Storage writes are blocking, so they run on a bounded pool instead of the event loop.
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "16"))
+# Uploads admitted at once (running + queued for a worker); beyond this callers wait.
+UPLOAD_MAX_PENDING = int(os.getenv("UPLOAD_MAX_PENDING", str(UPLOAD_WORKERS * 4)))
+# Seconds to wait for an admission slot before shedding load with a 503.
+UPLOAD_QUEUE_TIMEOUT = float(os.getenv("UPLOAD_QUEUE_TIMEOUT", "5"))
+# "spool" lets Starlette buffer the multipart file before writing it; "stream" pipes
+# body chunks straight into a chunked storage write.
+UPLOAD_INGEST = os.getenv("UPLOAD_INGEST", "spool")
+# Streaming write size, rounded up to the 256 KiB granularity of GCS resumable uploads.
+UPLOAD_CHUNK_SIZE = -(-int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024))) // (256 * 1024)) * 256 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(32 * 1024 * 1024)))
+# Files accepted per /upload/batch request, and how many of them are written concurrently.
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+BATCH_FANOUT = int(os.getenv("BATCH_FANOUT", "8"))
+# In-process LRU for small, frequently downloaded objects; 0 bytes disables it.
+DOWNLOAD_CACHE_BYTES = int(os.getenv("DOWNLOAD_CACHE_BYTES", str(64 * 1024 * 1024)))
+DOWNLOAD_CACHE_MAX_OBJECT_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_OBJECT_BYTES", str(1024 * 1024)))
+# Seconds a cached object is served before being revalidated against storage.
+DOWNLOAD_CACHE_TTL = float(os.getenv("DOWNLOAD_CACHE_TTL", "30"))
+# Size of each ranged storage read when streaming objects that are not cached.
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+# Per-route timing, storage time and bytes on /metrics and in Server-Timing headers.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Build the storage client in the background once serving starts, rather than in
+# the first request that needs it (it is never built during startup).
+STORAGE_PREWARM = os.getenv("STORAGE_PREWARM", "1") != "0"
 
-client = storage.Client()
-bucket = client.bucket(BUCKET)
+metrics = Metrics()
+storage = InstrumentedStorage(get_storage(), metrics) if METRICS_ENABLED else get_storage()
+# Tasks keep the request's context, so their storage time is credited to it
+upload_pool = ContextThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+upload_slots = asyncio.Semaphore(UPLOAD_MAX_PENDING)
+cache = ObjectCache(DOWNLOAD_CACHE_BYTES, DOWNLOAD_CACHE_MAX_OBJECT_BYTES, DOWNLOAD_CACHE_TTL)
 
-app = FastAPI(title="Cloud‑Run + GCS demo")
+
+@asynccontextmanager
+async def lifespan(app):
+    if STORAGE_PREWARM:
+        upload_pool.submit(storage.warm)
+    yield
+    upload_pool.shutdown(wait=True)
+
+app = FastAPI(title="Cloud‑Run + GCS demo", lifespan=lifespan)
+app.add_middleware(EchoClientHeaders)
+if METRICS_ENABLED:
+    # Added last so it is outermost and times the whole request
+    app.add_middleware(RequestMetrics, metrics=metrics)
 
 @app.get("/")
 def index():
-    return {"msg": "Upload with POST /upload and download with GET /download/{file}"}
+    return {"msg": "Upload with POST /upload (or many files with POST /upload/batch) "
+                   "and download with GET /download/{file}",
+            "storage_backend": storage.name}
+
+@asynccontextmanager
+async def upload_slot():
+    try:
+        await asyncio.wait_for(upload_slots.acquire(), UPLOAD_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(503, "upload queue full", headers={"Retry-After": "1"})
+    try:
+        yield
+    finally:
+        upload_slots.release()
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    blob = bucket.blob(file.filename)
-    blob.upload_from_file(file.file, content_type=file.content_type)
+async def upload_spooled(file: UploadFile = File(...)):
+    async with upload_slot():
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(upload_pool, storage.upload, file.filename, file.file, file.content_type)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    cache.invalidate(file.filename)
     return {"status": "ok", "file": file.filename}
 
+async def upload_streaming(request: Request):
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > UPLOAD_MAX_BYTES:
+        raise HTTPException(413, f"request body exceeds {UPLOAD_MAX_BYTES} bytes")
+    async with upload_slot():
+        try:
+            names = await stream_multipart(request, storage, upload_pool, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES)
+        except BodyTooLarge as e:
+            raise HTTPException(413, str(e))
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    if not names:
+        raise HTTPException(400, "no file part in request")
+    for name in names:
+        cache.invalidate(name)
+    return {"status": "ok", "file": names[0]}
+
+app.post("/upload")(upload_streaming if UPLOAD_INGEST == "stream" else upload_spooled)
+
+@app.post("/upload/batch")
+async def upload_batch(request: Request):
+    # The parser enforces the limit, so a batch over it is rejected at its first
+    # extra part instead of after the whole body has been spooled
+    parser = MultiPartParser(request.headers, request.stream(), max_files=BATCH_MAX_FILES)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        if e.message.startswith("Too many files"):
+            raise HTTPException(413, f"at most {BATCH_MAX_FILES} files per batch")
+        raise HTTPException(400, e.message)
+    try:
+        files = [file for file in form.getlist("files") if not isinstance(file, str)]
+        if not files:
+            raise HTTPException(400, "no files part in request")
+        return await store_batch(files)
+    finally:
+        await form.close()
+
+async def store_batch(files):
+    loop = asyncio.get_running_loop()
+    fanout = asyncio.Semaphore(BATCH_FANOUT)
+
+    async def write(file):
+        async with fanout:
+            try:
+                await loop.run_in_executor(upload_pool, storage.upload, file.filename, file.file, file.content_type)
+            except Exception as e:
+                return {"file": file.filename, "status": "error", "detail": str(e)}
+        cache.invalidate(file.filename)
+        return {"file": file.filename, "status": "ok"}
+
+    async with upload_slot():
+        results = await asyncio.gather(*(write(file) for file in files))
+    failed = sum(result["status"] != "ok" for result in results)
+    body = {"status": "ok" if not failed else "partial", "stored": len(files) - failed,
+            "failed": failed, "files": results}
+    return JSONResponse(body, status_code=207 if failed else 200)
+
 @app.get("/download/{name}")
-def download(name: str):
-    blob = bucket.blob(name)
-    if not blob.exists():
+def download(name: str, request: Request):
+    try:
+        data, info, cache_status = lookup(name)
+        headers = {"ETag": quote_etag(info.etag), "Accept-Ranges": "bytes"}
+        if cache_status:
+            headers["X-Cache"] = cache_status
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        if_range = request.headers.get("if-range")
+        byte_range = None
+        if not if_range or etag_matches_strong(if_range, headers["ETag"]):
+            byte_range = parse_range(request.headers.get("range"), info.size)
+        start, end = byte_range or (0, info.size - 1)
+        headers["Content-Length"] = str(end - start + 1)
+        if byte_range:
+            headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+        status_code = 206 if byte_range else 200
+        media_type = info.content_type or "application/octet-stream"
+        if data is not None:
+            return Response(data[start:end + 1], status_code=status_code, headers=headers, media_type=media_type)
+        body = storage.stream(name, start, end, info.etag, DOWNLOAD_CHUNK_SIZE)
+        return StreamingResponse(body, status_code=status_code, headers=headers, media_type=media_type)
+    except (FileNotFoundError, ValueError):
         raise HTTPException(404, "file not found")
-    stream = blob.open("rb")
-    return StreamingResponse(stream, media_type=blob.content_type or "application/octet-stream") 
\ No newline at end of file
+    except RangeNotSatisfiable:
+        raise HTTPException(416, "range not satisfiable", headers={"Content-Range": f"bytes */{info.size}"})
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+@app.get("/metrics")
+def metrics_text():
+    if not METRICS_ENABLED:
+        raise HTTPException(404, "metrics disabled")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def lookup(name):
+    """Returns (data, info, cache status); data is None when the body must be streamed."""
+    if not cache.enabled:
+        info = storage.stat(name)
+        if info is None:
+            raise FileNotFoundError(name)
+        return None, info, None
+    cached = cache.get(name)
+    if cached is not None:
+        data, info, fresh = cached
+        if fresh:
+            return data, info, "HIT"
+        info = storage.stat(name)
+        if cache.refresh(name, info):
+            return data, info, "REVALIDATED"
+    else:
+        info = storage.stat(name)
+    if info is None:
+        raise FileNotFoundError(name)
+    if not cache.admits(info.size):
+        return None, info, "BYPASS"
+    data, info = storage.read(name)
+    cache.put(name, data, info)
+    return data, info, "MISS"
@@ -0,0 +1,203 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from storage import ObjectWriter, StorageBackend
+
+# Prometheus' default latency buckets (seconds)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Timing of the request being handled; storage calls add to it from any thread
+# that runs in the request's context.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class RequestTiming:
+    __slots__ = ("start", "storage_seconds")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.storage_seconds = 0.0
+
+
+class Metrics:
+    """Process-wide request and storage counters, rendered in Prometheus text format.
+
+    Besides per-route time, bytes and storage time, it tracks busy time: wall time
+    with at least one request in flight. Cloud Run bills request-based CPU for
+    exactly that time, so busy seconds x vCPUs is the billable vCPU-seconds of
+    this instance. Thread-safe; storage calls report from worker threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Distinguishes Cloud Run instances behind the load balancer when scraping
+        self.instance = f"{os.getenv('K_REVISION', 'local')}-{uuid.uuid4().hex[:8]}"
+        self.started = time.time()
+        self.requests = defaultdict(int)  # (method, route, status) -> count
+        self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))  # (method, route) -> bucket counts
+        self.duration_sums = defaultdict(float)
+        self.request_storage = defaultdict(float)
+        self.bytes_in = defaultdict(int)
+        self.bytes_out = defaultdict(int)
+        self.storage_calls = defaultdict(int)  # operation -> count
+        self.storage_seconds = defaultdict(float)
+        self.in_flight = self.in_flight_max = 0
+        self.busy_seconds = 0.0
+        self.busy_since = None
+
+    def request_started(self):
+        with self.lock:
+            if self.in_flight == 0:
+                self.busy_since = time.perf_counter()
+            self.in_flight += 1
+            self.in_flight_max = max(self.in_flight_max, self.in_flight)
+
+    def request_finished(self, method, route, status, seconds, storage_seconds, bytes_in, bytes_out):
+        key = (method, route)
+        bucket = next((i for i, le in enumerate(DURATION_BUCKETS) if seconds <= le), len(DURATION_BUCKETS))
+        with self.lock:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.busy_seconds += time.perf_counter() - self.busy_since
+                self.busy_since = None
+            self.requests[(method, route, status)] += 1
+            self.durations[key][bucket] += 1
+            self.duration_sums[key] += seconds
+            self.request_storage[key] += storage_seconds
+            self.bytes_in[key] += bytes_in
+            self.bytes_out[key] += bytes_out
+
+    def observe_storage(self, operation, seconds):
+        timing = current_request.get()
+        with self.lock:
+            self.storage_calls[operation] += 1
+            self.storage_seconds[operation] += seconds
+            if timing is not None:
+                timing.storage_seconds += seconds
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+
+        def family(name, kind, help_text, rows):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in rows:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        def route_labels(key):
+            return [("method", key[0]), ("route", key[1])]
+
+        with self.lock:
+            busy = self.busy_seconds
+            if self.busy_since is not None:
+                busy += time.perf_counter() - self.busy_since
+            family("app_instance_info", "gauge", "Instance serving this scrape.",
+                   [([("instance", self.instance)], 1)])
+            family("app_start_time_seconds", "gauge", "Unix time the process started.",
+                   [([], self.started)])
+            family("process_cpu_seconds_total", "counter", "CPU time used by the process.",
+                   [([], time.process_time())])
+            family("app_busy_seconds_total", "counter",
+                   "Wall time with at least one request in flight (request-based billable time).",
+                   [([], busy)])
+            family("app_requests_in_flight", "gauge", "Requests being handled.",
+                   [([], self.in_flight)])
+            family("app_requests_in_flight_max", "gauge", "Most requests handled at once.",
+                   [([], self.in_flight_max)])
+            family("app_requests_total", "counter", "Completed requests.",
+                   [([("method", m), ("route", r), ("status", s)], n)
+                    for (m, r, s), n in sorted(self.requests.items())])
+            lines.append("# HELP app_request_duration_seconds Server time per request, until the response body was sent.")
+            lines.append("# TYPE app_request_duration_seconds histogram")
+            for key, counts in sorted(self.durations.items()):
+                labels = f'method="{key[0]}",route="{key[1]}"'
+                cumulative = 0
+                for le, count in zip(DURATION_BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'app_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"app_request_duration_seconds_sum{{{labels}}} {self.duration_sums[key]}")
+                lines.append(f"app_request_duration_seconds_count{{{labels}}} {cumulative}")
+            family("app_request_storage_seconds_total", "counter", "Storage time spent on behalf of requests.",
+                   [(route_labels(k), v) for k, v in sorted(self.request_storage.items())])
+            family("app_request_bytes_total", "counter", "Request body bytes received.",
+                   [(route_labels(k), v) for k, v in sorted(self.bytes_in.items())])
+            family("app_response_bytes_total", "counter", "Response body bytes sent.",
+                   [(route_labels(k), v) for k, v in sorted(self.bytes_out.items())])
+            family("app_storage_calls_total", "counter", "Storage backend calls.",
+                   [([("operation", op)], n) for op, n in sorted(self.storage_calls.items())])
+            family("app_storage_seconds_total", "counter", "Time spent in storage backend calls.",
+                   [([("operation", op)], v) for op, v in sorted(self.storage_seconds.items())])
+        return "\n".join(lines) + "\n"
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs each task in the submitter's contextvars context,
+    so storage time on a worker thread is credited to the request that caused it."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class InstrumentedStorage(StorageBackend):
+    """Wraps a backend and reports the time of every call to `metrics`."""
+
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+        self.name = backend.name
+
+    def timed(self, operation, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.metrics.observe_storage(operation, time.perf_counter() - start)
+
+    def upload(self, name, fileobj, content_type=None):
+        return self.timed("upload", self.backend.upload, name, fileobj, content_type)
+
+    def open_writer(self, name, content_type=None, chunk_size=None):
+        writer = self.timed("open_writer", self.backend.open_writer, name, content_type, chunk_size)
+        return _InstrumentedWriter(writer, self)
+
+    def stat(self, name):
+        return self.timed("stat", self.backend.stat, name)
+
+    def read(self, name):
+        return self.timed("read", self.backend.read, name)
+
+    def warm(self):
+        self.backend.warm()
+
+    def stream(self, name, start, end, etag=None, chunk_size=256 * 1024):
+        chunks = iter(self.timed("stream", self.backend.stream, name, start, end, etag, chunk_size))
+        return self._timed_chunks(chunks)
+
+    def _timed_chunks(self, chunks):
+        while True:
+            try:
+                chunk = self.timed("stream", next, chunks)
+            except StopIteration:
+                return
+            yield chunk
+
+
+class _InstrumentedWriter(ObjectWriter):
+    def __init__(self, writer, storage):
+        self.writer = writer
+        self.storage = storage
+
+    def write(self, data):
+        return self.storage.timed("write", self.writer.write, data)
+
+    def commit(self):
+        return self.storage.timed("commit", self.writer.commit)
+
+    def discard(self):
+        return self.storage.timed("discard", self.writer.discard)
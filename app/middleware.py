@@ -0,0 +1,91 @@
+import time
+from metrics import RequestTiming, current_request
+
+
+class EchoClientHeaders:
+    """Echoes the load generator's X-Client-* request headers on the response.
+
+    wrk's response() hook cannot tell which request a response belongs to, so the
+    scripts in scripts/ tag each request (X-Client-Sent timestamp, X-Client-Op
+    operation) and read the tags back to get per-response latency and operation.
+    Pure ASGI to keep overhead minimal.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        echoed = [(key, value) for key, value in scope["headers"] if key.startswith(b"x-client-")]
+        if not echoed:
+            return await self.app(scope, receive, send)
+
+        async def send_with_echo(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *echoed]
+            await send(message)
+
+        await self.app(scope, receive, send_with_echo)
+
+
+class RequestMetrics:
+    """Records server time, storage time, body bytes and concurrency of each request.
+
+    Adds a Server-Timing header (`app` = time until the response started, `storage`
+    = storage time so far) and feeds `metrics`, which the /metrics route renders.
+    Requests for `skip_paths` (the scrape itself) are not recorded. Pure ASGI, so
+    streamed bodies are counted as they are sent.
+    """
+
+    def __init__(self, app, metrics, skip_paths=("/metrics",)):
+        self.app = app
+        self.metrics = metrics
+        self.skip_paths = set(skip_paths)
+        self.routes = {}  # endpoint -> path template, e.g. "/download/{name}"
+
+    def route_of(self, scope):
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self.routes:
+            self.routes.update((r.endpoint, r.path) for r in scope["app"].routes if hasattr(r, "endpoint"))
+        return self.routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            return await self.app(scope, receive, send)
+        timing = RequestTiming()
+        token = current_request.set(timing)
+        self.metrics.request_started()
+        status = 500
+        bytes_in = bytes_out = 0
+
+        async def counting_receive():
+            nonlocal bytes_in
+            message = await receive()
+            if message["type"] == "http.request":
+                bytes_in += len(message.get("body", b""))
+            return message
+
+        async def timed_send(message):
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                server_timing = (f"app;dur={(time.perf_counter() - timing.start) * 1000:.1f}, "
+                                 f"storage;dur={timing.storage_seconds * 1000:.1f}")
+                message["headers"] = [*message.get("headers", []), (b"server-timing", server_timing.encode())]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timed_send)
+        finally:
+            current_request.reset(token)
+            self.metrics.request_finished(scope["method"], self.route_of(scope), str(status),
+                                          time.perf_counter() - timing.start,
+                                          timing.storage_seconds, bytes_in, bytes_out)
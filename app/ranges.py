@@ -0,0 +1,55 @@
+import re
+
+_RANGE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def quote_etag(etag):
+    return f'"{etag}"'
+
+
+def etag_matches(header, etag):
+    """Weak comparison of an If-None-Match value against a quoted ETag."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def etag_matches_strong(header, etag):
+    """Strong comparison of an If-Range value against a quoted ETag: a weak
+    validator never matches (RFC 9110 13.1.5), nor does an HTTP-date."""
+    if not header:
+        return False
+    tag = header.strip()
+    return not tag.startswith("W/") and tag == etag
+
+
+def parse_range(header, size):
+    """Returns the inclusive (start, end) of a single `bytes=` range, or None.
+
+    Multi-range and malformed headers yield None (serve the whole object, as RFC 9110
+    allows); a well-formed range outside the object raises RangeNotSatisfiable.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header)
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, end
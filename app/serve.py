@@ -0,0 +1,45 @@
+import math
+import os
+import uvicorn
+
+
+def cpu_count():
+    """CPUs this container may use: the cgroup CPU quota (what Cloud Run's `cpu`
+    limit sets), else the CPUs the process may run on."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:  # cgroup v1
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+def main():
+    # Processes serving the port. "auto" runs one per CPU; each process keeps its
+    # own cache, upload pool and metrics.
+    workers = os.getenv("WEB_CONCURRENCY", "1")
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        workers=cpu_count() if workers == "auto" else int(workers),
+        # "auto" picks uvloop and httptools when installed (uvicorn[standard])
+        loop=os.getenv("UVICORN_LOOP", "auto"),
+        http=os.getenv("UVICORN_HTTP", "auto"),
+        access_log=os.getenv("ACCESS_LOG", "1") != "0",
+    )
+
+
+if __name__ == "__main__":
+    main()
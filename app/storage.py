@@ -0,0 +1,304 @@
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+from io import BytesIO
+
+
+# `etag` changes whenever the object is rewritten (the generation, for GCS).
+ObjectInfo = namedtuple("ObjectInfo", "size content_type etag")
+
+
+class ObjectWriter:
+    """Incremental write of one object; nothing is visible until `commit`."""
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def discard(self):
+        pass
+
+
+class StorageBackend:
+    """Object store used by the app; `open` raises FileNotFoundError for unknown names."""
+
+    name = None
+
+    def upload(self, name, fileobj, content_type=None):
+        raise NotImplementedError
+
+    def open_writer(self, name, content_type=None, chunk_size=None):
+        raise NotImplementedError
+
+    def stat(self, name):
+        """Returns the ObjectInfo of `name`, or None if it does not exist."""
+        raise NotImplementedError
+
+    def read(self, name):
+        """Returns (data, ObjectInfo) for the whole object in one consistent read."""
+        raise NotImplementedError
+
+    def stream(self, name, start, end, etag=None, chunk_size=256 * 1024):
+        """Returns an iterator over bytes `start`..`end` (inclusive) of the object.
+
+        `etag`, when given, pins the read to that version where the backend can.
+        Raises FileNotFoundError, before any data is produced, if the object (or
+        that version) does not exist when the stream is opened.
+        """
+        raise NotImplementedError
+
+    def warm(self):
+        """Does any slow first-use setup now instead of in the first request."""
+
+
+class GCSStorage(StorageBackend):
+    """Objects in a GCS bucket.
+
+    The client library (a large import tree) is loaded and the client, which
+    looks up credentials, is built on first use, so they stay off the
+    container's startup path; `warm` does it ahead of the first request.
+    """
+
+    name = "gcs"
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    from google.cloud import storage as gcs
+                    self._bucket = gcs.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def warm(self):
+        self.bucket
+
+    def upload(self, name, fileobj, content_type=None):
+        self.bucket.blob(name).upload_from_file(fileobj, content_type=content_type)
+
+    def open_writer(self, name, content_type=None, chunk_size=None):
+        # BlobWriter does a resumable upload, sending one chunk_size piece at a time.
+        return _GCSWriter(self.bucket.blob(name).open("wb", content_type=content_type, chunk_size=chunk_size))
+
+    @staticmethod
+    def _info(blob):
+        return ObjectInfo(blob.size, blob.content_type, str(blob.generation))
+
+    def stat(self, name):
+        blob = self.bucket.get_blob(name)
+        return self._info(blob) if blob is not None else None
+
+    def read(self, name):
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(name)
+        # The blob carries its generation, so the download cannot race a rewrite.
+        return blob.download_as_bytes(), self._info(blob)
+
+    def stream(self, name, start, end, etag=None, chunk_size=256 * 1024):
+        from google.api_core.exceptions import NotFound
+        blob = self.bucket.blob(name, generation=int(etag) if etag else None)
+        # BlobReader only fetches on the first read, after the response headers
+        # are out, so check the object exists now; the reload also pins the
+        # generation when no etag was given.
+        try:
+            blob.reload()
+        except NotFound:
+            raise FileNotFoundError(name)
+        blob = self.bucket.blob(name, generation=blob.generation)
+        # BlobReader turns seek + read into ranged GET requests of chunk_size bytes.
+        reader = blob.open("rb", chunk_size=chunk_size)
+        return _iter_file(reader, start, end, chunk_size)
+
+
+class LocalStorage(StorageBackend):
+    """Objects stored as files in one directory; `latency_ms` emulates a remote write."""
+
+    name = "local"
+
+    def __init__(self, root, latency_ms=0.0):
+        self.root = root
+        self.latency = latency_ms / 1000.0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        if not name or name in (".", "..") or "/" in name or "\\" in name:
+            raise ValueError(f"invalid object name: {name!r}")
+        return os.path.join(self.root, name)
+
+    @staticmethod
+    def _tmp_path(path):
+        # Unique per write: concurrent uploads of one name must not share a file
+        return f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def upload(self, name, fileobj, content_type=None):
+        path = self._path(name)
+        tmp = self._tmp_path(path)
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        if self.latency:
+            time.sleep(self.latency)
+        os.replace(tmp, path)
+
+    def open_writer(self, name, content_type=None, chunk_size=None):
+        path = self._path(name)
+        return _FileWriter(path, self._tmp_path(path), self.latency)
+
+    def stream(self, name, start, end, etag=None, chunk_size=256 * 1024):
+        return _iter_file(open(self._path(name), "rb"), start, end, chunk_size)
+
+    def _info(self, name, st):
+        return ObjectInfo(st.st_size, mimetypes.guess_type(name)[0], f"{st.st_mtime_ns:x}-{st.st_size:x}")
+
+    def stat(self, name):
+        try:
+            return self._info(name, os.stat(self._path(name)))
+        except FileNotFoundError:
+            return None
+
+    def read(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read(), self._info(name, os.fstat(f.fileno()))
+
+
+class MemoryStorage(StorageBackend):
+    """In-memory stand-in for GCS; `latency_ms` emulates a blocking write."""
+
+    name = "memory"
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.objects = {}  # name -> (data, ObjectInfo)
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def upload(self, name, fileobj, content_type=None):
+        data = fileobj.read()
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.generation += 1
+            self.objects[name] = (data, ObjectInfo(len(data), content_type, str(self.generation)))
+
+    def open_writer(self, name, content_type=None, chunk_size=None):
+        return _MemoryWriter(self, name, content_type)
+
+    def stream(self, name, start, end, etag=None, chunk_size=256 * 1024):
+        data, _ = self.read(name)
+        view = memoryview(data)
+        return (bytes(view[i:min(i + chunk_size, end + 1)]) for i in range(start, end + 1, chunk_size))
+
+    def stat(self, name):
+        with self.lock:
+            entry = self.objects.get(name)
+        return entry[1] if entry is not None else None
+
+    def read(self, name):
+        with self.lock:
+            if name not in self.objects:
+                raise FileNotFoundError(name)
+            return self.objects[name]
+
+
+def _iter_file(f, start, end, chunk_size):
+    with f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+class _GCSWriter(ObjectWriter):
+    def __init__(self, blob_writer):
+        self.blob_writer = blob_writer
+
+    def write(self, data):
+        self.blob_writer.write(data)
+
+    def commit(self):
+        self.blob_writer.close()
+
+    def discard(self):
+        # close() would finalize the upload with what was written so far, and so
+        # would garbage collection of an open BlobWriter. Closing its buffer makes
+        # close() a no-op; the resumable session, if started, is cancelled so GCS
+        # drops the chunks already sent (BlobWriter has no public abort).
+        upload_and_transport = self.blob_writer._upload_and_transport
+        self.blob_writer._buffer.close()
+        if upload_and_transport:
+            upload, transport = upload_and_transport
+            if upload.resumable_url and not upload.finished:
+                try:
+                    transport.delete(upload.resumable_url)
+                except Exception:
+                    pass  # An abandoned session expires on its own
+
+
+class _FileWriter(ObjectWriter):
+    def __init__(self, path, tmp, latency):
+        self.path = path
+        self.tmp = tmp
+        self.latency = latency
+        self.file = open(tmp, "wb")
+
+    def write(self, data):
+        self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        if self.latency:
+            time.sleep(self.latency)
+        os.replace(self.tmp, self.path)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp)
+        except FileNotFoundError:
+            pass
+
+
+class _MemoryWriter(ObjectWriter):
+    def __init__(self, storage, name, content_type):
+        self.storage = storage
+        self.name = name
+        self.content_type = content_type
+        self.buffer = BytesIO()
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def commit(self):
+        self.buffer.seek(0)
+        self.storage.upload(self.name, self.buffer, self.content_type)
+
+
+def get_storage():
+    """Builds the backend named by STORAGE_BACKEND (gcs, local or memory)."""
+    backend = os.getenv("STORAGE_BACKEND", "gcs")
+    latency_ms = float(os.getenv("STORAGE_LATENCY_MS", os.getenv("FAKE_STORAGE_LATENCY_MS", "0")))
+    if backend in ("memory", "fake"):
+        return MemoryStorage(latency_ms)
+    if backend == "local":
+        return LocalStorage(os.getenv("LOCAL_STORAGE_DIR", "/tmp/image-saver"), latency_ms)
+    if backend != "gcs":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {backend!r}; expected gcs, local or memory")
+    bucket = os.getenv("BUCKET_NAME")
+    if not bucket:
+        raise RuntimeError("BUCKET_NAME env var is required")
+    return GCSStorage(bucket)
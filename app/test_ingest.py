@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ingest import stream_multipart
+from storage import LocalStorage
+
+BOUNDARY = "testboundary"
+
+
+class FakeRequest:
+    def __init__(self, body, chunk_size=7):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def part(filename, data):
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; "
+            f"filename=\"{filename}\"\r\nContent-Type: text/plain\r\n\r\n").encode() + data
+
+
+def ingest(storage, body):
+    with ThreadPoolExecutor(2) as pool:
+        return asyncio.run(stream_multipart(FakeRequest(body), storage, pool, 16, 1 << 20))
+
+
+def test_complete_body_is_committed(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    body = part("whole.txt", b"all of the data") + f"\r\n--{BOUNDARY}--\r\n".encode()
+    assert ingest(storage, body) == ["whole.txt"]
+    assert (tmp_path / "whole.txt").read_bytes() == b"all of the data"
+
+
+def test_truncated_body_is_rejected_and_cleaned_up(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with pytest.raises(ValueError):
+        ingest(storage, part("trunc.txt", b"no closing boundary"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_concurrent_writers_of_one_name_do_not_share_a_temp_file(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    first = storage.open_writer("same.txt")
+    second = storage.open_writer("same.txt")
+    first.write(b"first")
+    second.write(b"second")
+    first.commit()
+    second.commit()
+    assert (tmp_path / "same.txt").read_bytes() == b"second"
+    assert [p.name for p in tmp_path.iterdir()] == ["same.txt"]
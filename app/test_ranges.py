@@ -0,0 +1,29 @@
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from fastapi.testclient import TestClient
+
+import main
+from ranges import etag_matches, etag_matches_strong
+
+
+def test_if_range_needs_a_strong_match():
+    assert etag_matches_strong('"abc"', '"abc"')
+    assert not etag_matches_strong('W/"abc"', '"abc"')
+    assert not etag_matches_strong('"other"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+
+
+def test_weak_if_range_gets_the_whole_object():
+    with TestClient(main.app) as client:
+        client.post("/upload", files={"file": ("ranged.bin", b"0123456789", "application/octet-stream")})
+        etag = client.get("/download/ranged.bin").headers["etag"]
+
+        strong = client.get("/download/ranged.bin", headers={"Range": "bytes=2-4", "If-Range": etag})
+        assert strong.status_code == 206
+        assert strong.content == b"234"
+
+        weak = client.get("/download/ranged.bin", headers={"Range": "bytes=2-4", "If-Range": f"W/{etag}"})
+        assert weak.status_code == 200
+        assert weak.content == b"0123456789"
@@ -82,6 +82,11 @@ resource "google_cloud_run_v2_service" "image_saver_service" {
         name  = "BUCKET_NAME"
         value = google_storage_bucket.images_bucket.name
       }
+      env {
+        # One storage worker thread per admitted request
+        name  = "UPLOAD_WORKERS"
+        value = tostring(var.concurrency_limit)
+      }
       resources {
         limits = {
           "memory" = "${var.memory_mb}Mi"
@@ -93,8 +98,8 @@ resource "google_cloud_run_v2_service" "image_saver_service" {
       }
     }
     scaling {
-      # Keep at least 1 instance running 24/7
-      min_instance_count = 1 # Or set higher based on var.min_instances if you want > 0 always
+      # 0 allows scale to zero (cold starts); sweeps vary this
+      min_instance_count = var.min_instances
       max_instance_count = var.max_instances
     }
     max_instance_request_concurrency = var.concurrency_limit
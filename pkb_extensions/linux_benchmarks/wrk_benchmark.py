@@ -14,13 +14,21 @@
 
 """Basic benchmark to run wrk against a target URL."""
 
+import collections
+import json
 import logging
+import math
+import os
 import re
+import time
+from urllib import parse
 from absl import flags
+from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker import benchmark_spec as bm_spec
 from perfkitbenchmarker import configs
 from perfkitbenchmarker import sample
 from perfkitbenchmarker.linux_packages import wrk
+from perfkitbenchmarker.linux_packages import wrk2
 
 
 # Define flags specific to this custom benchmark using PKB's flag system
@@ -36,6 +44,33 @@ flags.DEFINE_string('wrk_script_remote_path', 'request.lua',
 flags.DEFINE_list('wrk_script_data_files', [],
                   'Data files needed by the Lua script, relative to PKB root.')
 flags.DEFINE_string('wrk_flags', '', 'Additional flags for wrk.')
+flags.DEFINE_list('wrk_script_env', [],
+                  'Environment variables for the Lua script as KEY=VALUE, '
+                  'e.g. "WRK_WRITE_PERCENT=10,WRK_KEY_DIST=uniform".')
+flags.DEFINE_enum('wrk_load_profile', 'constant',
+                  ['constant', 'ramp', 'step', 'spike', 'soak'],
+                  'Shape of the load schedule derived from wrk_num_conns and '
+                  'wrk_duration. Ignored when wrk_load_stages is set.')
+flags.DEFINE_integer('wrk_load_steps', 4,
+                     'Number of stages used by the ramp and step profiles, and '
+                     'of full-load windows of wrk_duration run by soak.')
+flags.DEFINE_list('wrk_load_stages', [],
+                  'Explicit load schedule run in order. Each stage is '
+                  '"connections:duration_sec[:rate]", e.g. "8:30,64:60,256:60".')
+flags.DEFINE_integer('wrk_rate', None,
+                     'Target requests/sec. When set (or when a stage has a '
+                     'rate) load is generated open-loop with wrk2 and latency '
+                     'percentiles are corrected for coordinated omission. '
+                     'Profile stages scale this rate like their connections.')
+flags.DEFINE_string('wrk_metrics_path', '/metrics',
+                    'Path of the app\'s Prometheus-style metrics, scraped from the '
+                    'first client before and after every stage. Empty disables.')
+flags.DEFINE_integer('wrk_metrics_scrapes', 10,
+                     'Scrapes per snapshot. Each scrape reaches one instance '
+                     'behind the load balancer, so several cover more of them.')
+flags.DEFINE_integer('wrk_client_start_delay', 5,
+                     'With several client VMs, seconds from issuing a stage '
+                     'until all clients start wrk at the same wall-clock time.')
 
 
 FLAGS = flags.FLAGS
@@ -50,15 +85,30 @@ wrk:
       vm_spec:
         GCP:
           machine_type: e2-standard-2
+      vm_count: 1 # Every VM in the group runs wrk concurrently
 """
 
+# One wrk invocation of a load schedule. rate is the target requests/sec, or
+# None for closed-loop load where each connection sends as fast as it can.
+Stage = collections.namedtuple('Stage', ['name', 'connections', 'duration', 'rate'])
+
+
 def GetConfig(user_config):
   return configs.LoadConfig(BENCHMARK_CONFIG, user_config, BENCHMARK_NAME)
 
 def Prepare(benchmark_spec: bm_spec.BenchmarkSpec):
-  """Install wrk tool on the client VM."""
-  vm = benchmark_spec.vm_groups['default'][0]
+  """Install wrk tool on every client VM."""
+  background_tasks.RunThreaded(_PrepareClient, benchmark_spec.vm_groups['default'])
+
+
+# Files next to the Lua script that it may load with dofile()
+_LUA_HELPERS = ['latency_histogram.lua']
+
+
+def _PrepareClient(vm):
   vm.Install('wrk') # Uses the wrk package definition in PKB
+  if any(stage.rate for stage in GetLoadStages()):
+    vm.Install('wrk2') # Open-loop stages run wrk2 instead
 
   # Copy the Lua script and any data files if specified in config/flags
   if FLAGS.wrk_script_local_path:
@@ -67,6 +117,12 @@ def Prepare(benchmark_spec: bm_spec.BenchmarkSpec):
     vm.PushFile(script_local_path, script_remote_path)
     logging.info('Copied wrk Lua script %s to %s on VM',
                  script_local_path, script_remote_path)
+    # Shared Lua code the scripts load with dofile(), kept next to the script
+    for helper in _LUA_HELPERS:
+      helper_local_path = os.path.join(os.path.dirname(script_local_path), helper)
+      if os.path.exists(helper_local_path):
+        vm.PushFile(helper_local_path,
+                    os.path.join(os.path.dirname(script_remote_path), helper))
 
   if FLAGS.wrk_script_data_files:
     for data_file in FLAGS.wrk_script_data_files:
@@ -82,53 +138,584 @@ def Prepare(benchmark_spec: bm_spec.BenchmarkSpec):
           # Decide if this is fatal or not
 
 
-def Run(benchmark_spec: bm_spec.BenchmarkSpec):
-  """Run wrk against the target URL and collect results."""
-  vm = benchmark_spec.vm_groups['default'][0]
-  results = []
+def _ParseStage(index, spec):
+  """Parses a "connections:duration_sec[:rate]" wrk_load_stages entry."""
+  parts = spec.strip().split(':')
+  if len(parts) not in (2, 3):
+    raise ValueError(f'Invalid wrk_load_stages entry {spec!r}; expected '
+                     '"connections:duration_sec[:rate]".')
+  rate = float(parts[2]) if len(parts) == 3 and parts[2] else FLAGS.wrk_rate
+  return Stage(f'stage{index}', int(parts[0]), int(parts[1].rstrip('s')), rate)
 
-  # Build the wrk command using flags defined for this benchmark
-  # These flags are populated from the benchmark config YAML or command line overrides
-  target_url = FLAGS.wrk_target_url
-  if not target_url:
-    raise ValueError('wrk_target_url must be specified.')
 
-  cmd = [
-      wrk.WRK_PATH,  # Use the path directly, it already points to the executable
-      f'--connections={FLAGS.wrk_num_conns}',
-      f'--threads={FLAGS.wrk_num_threads}',
-      f'--duration={FLAGS.wrk_duration}s' # Add 's' suffix for wrk
+def GetLoadStages():
+  """Returns the list of Stages to run, from wrk_load_stages or the profile."""
+  if FLAGS.wrk_load_stages:
+    return [_ParseStage(i, spec) for i, spec in enumerate(FLAGS.wrk_load_stages)]
+
+  profile = FLAGS.wrk_load_profile
+  duration = FLAGS.wrk_duration
+
+  def scaled(name, fraction, stage_duration):
+    # A stage at `fraction` of full load: connections and, if open-loop, rate.
+    rate = FLAGS.wrk_rate * fraction if FLAGS.wrk_rate else None
+    return Stage(name, max(1, int(FLAGS.wrk_num_conns * fraction)),
+                 max(1, stage_duration), rate)
+
+  if profile == 'constant':
+    return [scaled(profile, 1, duration)]
+  if profile == 'soak':
+    # Full load held for wrk_load_steps * wrk_duration, measured per window so
+    # drift over the run (latency creep, leaks, throttling) shows between stages
+    return [scaled(f'soak{i}', 1, duration)
+            for i in range(1, max(1, FLAGS.wrk_load_steps) + 1)]
+  if profile == 'spike':
+    return [scaled('baseline', 0.25, duration * 2 // 5),
+            scaled('spike', 1, duration // 5),
+            scaled('recovery', 0.25, duration * 2 // 5)]
+  # ramp and step both climb to full load; a ramp uses more, shorter stages
+  # to approximate a continuous increase, since each wrk run has a fixed load.
+  steps = max(1, FLAGS.wrk_load_steps * (3 if profile == 'ramp' else 1))
+  return [scaled(f'{profile}{i}', i / steps, duration // steps)
+          for i in range(1, steps + 1)]
+
+
+def _BuildCommand(stage, target_url):
+  # Script tunables are read with os.getenv, so pass them through env(1)
+  script_env = list(FLAGS.wrk_script_env)
+  if stage.rate:
+    # wrk2's corrected histogram replaces the one the Lua script would print
+    script_env.append('WRK_LATENCY_HISTOGRAM=0')
+  cmd = ['env'] + script_env if script_env else []
+  cmd += [
+      # Use the path directly, it already points to the executable
+      wrk2.WRK2_PATH if stage.rate else wrk.WRK_PATH,
+      f'--connections={stage.connections}',
+      # wrk requires at least one connection per thread
+      f'--threads={min(FLAGS.wrk_num_threads, stage.connections)}',
+      f'--duration={stage.duration}s' # Add 's' suffix for wrk
   ]
+  if stage.rate:
+      # --latency prints wrk2's HdrHistogram, corrected for coordinated omission
+      cmd += [f'--rate={max(1, int(stage.rate))}', '--latency']
   if FLAGS.wrk_script_local_path:
       cmd.append(f'--script={FLAGS.wrk_script_remote_path}')
   if FLAGS.wrk_flags:
       cmd.append(FLAGS.wrk_flags)
 
   cmd.append(target_url) # URL is the last argument for wrk
+  return cmd
+
+
+# Prints the client's CPU counters tagged with a marker, e.g. PKB_CPU_START cpu0 ...
+_CPU_SNAPSHOT_CMD = 'grep "^cpu" /proc/stat | sed "s/^/{marker} /"'
 
-  logging.info('Running wrk command: %s', ' '.join(cmd))
-  stdout, stderr, retcode = vm.RemoteCommandWithReturnCode(' '.join(cmd), ignore_failure=False)
 
-  logging.info('wrk command finished with return code %d', retcode)
+def _RunClient(vm, cmd, start_at=None):
+  """Runs one wrk command on `vm`, optionally waiting until epoch `start_at`.
+
+  /proc/stat is captured right before and after wrk, in the same shell, so the
+  client's CPU utilization covers exactly the load period.
+  """
+  cmd = (f'{_CPU_SNAPSHOT_CMD.format(marker="PKB_CPU_START")} && {cmd}; rc=$?; '
+         f'{_CPU_SNAPSHOT_CMD.format(marker="PKB_CPU_END")}; exit $rc')
+  if start_at is not None:
+    # Sleep on the VM itself so SSH setup time does not skew the start.
+    cmd = (f'python3 -c "import time; time.sleep(max(0, {start_at:.3f} - time.time()))"'
+           f' && {cmd}')
+  stdout, stderr, retcode = vm.RemoteCommandWithReturnCode(cmd, ignore_failure=True)
+
+  logging.info('wrk command on %s finished with return code %d', vm.name, retcode)
   logging.info('wrk stdout:\n%s', stdout)
   logging.info('wrk stderr:\n%s', stderr)
+  return stdout, retcode
+
+
+def Run(benchmark_spec: bm_spec.BenchmarkSpec):
+  """Run wrk from every client VM, once per load stage, and collect results."""
+  vms = benchmark_spec.vm_groups['default']
+  results = []
+
+  # Build the wrk command using flags defined for this benchmark
+  # These flags are populated from the benchmark config YAML or command line overrides
+  target_url = FLAGS.wrk_target_url
+  if not target_url:
+    raise ValueError('wrk_target_url must be specified.')
+
+  metrics_url = None
+  if FLAGS.wrk_metrics_path:
+    metrics_url = parse.urljoin(target_url, FLAGS.wrk_metrics_path)
+
+  stages = GetLoadStages()
+  for index, stage in enumerate(stages):
+    cmd = ' '.join(_BuildCommand(stage, target_url))
+    logging.info('Running wrk stage %d/%d (%s) on %d client(s): %s',
+                 index + 1, len(stages), stage.name, len(vms), cmd)
+    server_before = _ScrapeServerMetrics(vms[0], metrics_url) if metrics_url else {}
+    start_at = time.time() + FLAGS.wrk_client_start_delay if len(vms) > 1 else None
+    outputs = background_tasks.RunThreaded(
+        lambda vm: _RunClient(vm, cmd, start_at), vms)
+    server_after = _ScrapeServerMetrics(vms[0], metrics_url) if metrics_url else {}
+
+    metadata = {
+        'wrk_threads': min(FLAGS.wrk_num_threads, stage.connections),
+        'wrk_connections': stage.connections,
+        'wrk_duration': stage.duration,
+        'wrk_target_url': target_url,
+        'wrk_script': FLAGS.wrk_script_remote_path if FLAGS.wrk_script_local_path else 'None',
+        'wrk_custom_flags': FLAGS.wrk_flags or 'None',
+        'wrk_load_profile': 'custom' if FLAGS.wrk_load_stages else FLAGS.wrk_load_profile,
+        'wrk_stage': stage.name,
+        'wrk_stage_index': index,
+        'wrk_stage_count': len(stages),
+        'wrk_open_loop': bool(stage.rate),
+        'wrk_target_rate': stage.rate or 'None',
+        'wrk_num_clients': len(vms),
+    }
+    client_results = []
+    for client_index, (vm, (stdout, retcode)) in enumerate(zip(vms, outputs)):
+      # Check return code BEFORE parsing
+      if retcode != 0:
+        logging.error('wrk stage %s failed on %s with return code %d',
+                      stage.name, vm.name, retcode)
+        # Skip this client; the other clients and stages are still reported
+        continue
+      client_metadata = dict(metadata, command_return_code=retcode)
+      if len(vms) > 1:
+        client_metadata.update(wrk_client=vm.name, wrk_client_index=client_index)
+      client_results.append(_ParseOutput(stdout, client_metadata))
+
+    # Combined samples come first, so readers taking the first match of a
+    # metric get the whole-fleet number.
+    if len(vms) > 1 and client_results:
+      results.extend(_AggregateClients(client_results, dict(
+          metadata, wrk_client='all', wrk_clients_reporting=len(client_results))))
+    for client_samples in client_results:
+      results.extend(client_samples)
+    results.extend(_ServerSamples(server_before, server_after, metadata))
+
+  return results # Return the list containing all parsed samples
+
+
+def _ParsePrometheusText(text):
+  """Returns {(name, ((label, value), ...)): value} for a text exposition."""
+  values = {}
+  for line in text.splitlines():
+    match = re.match(r'([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$', line.strip())
+    if not match or line.startswith('#'):
+      continue
+    labels = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', match.group(2) or '')))
+    try:
+      values[(match.group(1), labels)] = float(match.group(3))
+    except ValueError:
+      continue
+  return values
+
+
+def _ScrapeServerMetrics(vm, url):
+  """Scrapes the app's /metrics from `vm`; returns {instance: parsed metrics}.
+
+  Requests go through the load balancer, so each scrape lands on some instance;
+  the last scrape per instance wins. Instances are told apart by app_instance_info.
+  """
+  cmd = (f'for i in $(seq {FLAGS.wrk_metrics_scrapes}); do '
+         f'curl -s --max-time 5 -H "Connection: close" "{url}"; echo PKB_SCRAPE_END; done')
+  stdout, _, _ = vm.RemoteCommandWithReturnCode(cmd, ignore_failure=True)
+  snapshots = {}
+  for block in stdout.split('PKB_SCRAPE_END'):
+    values = _ParsePrometheusText(block)
+    instance = next((dict(labels)['instance'] for name, labels in values
+                     if name == 'app_instance_info'), None)
+    if instance:
+      snapshots[instance] = values
+  if not snapshots:
+    logging.warning('No server metrics scraped from %s', url)
+  return snapshots
+
+
+def _MetricTotal(values, name):
+  return sum(v for (metric, _), v in values.items() if metric == name)
+
+
+def _ServerSamples(before, after, metadata):
+  """Server-side samples of one stage from /metrics snapshots taken around it.
+
+  Counters are differenced per instance (an instance first seen after the stage
+  started from zero). Per-request values are ratios over the instances that were
+  scraped, so they hold even when a scrape missed some instances; totals only
+  cover those instances.
+  """
+  if not after:
+    return []
+  deltas = collections.Counter()
+  max_concurrency = 0
+  for instance, values in after.items():
+    previous = before.get(instance, {})
+    for name in ('app_requests_total', 'app_request_duration_seconds_sum', 'app_busy_seconds_total',
+                 'process_cpu_seconds_total', 'app_request_storage_seconds_total',
+                 'app_request_bytes_total', 'app_response_bytes_total'):
+      deltas[name] += _MetricTotal(values, name) - _MetricTotal(previous, name)
+    max_concurrency = max(max_concurrency, _MetricTotal(values, 'app_requests_in_flight_max'))
+
+  server_metadata = dict(metadata, server_instances_scraped=len(after))
+  requests = deltas['app_requests_total']
+  results = [
+      sample.Sample('Server Requests', requests, 'requests', server_metadata),
+      sample.Sample('Server Busy Time', deltas['app_busy_seconds_total'], 'sec', server_metadata),
+      sample.Sample('Server CPU Time', deltas['process_cpu_seconds_total'], 'sec', server_metadata),
+      sample.Sample('Server Request Bytes', deltas['app_request_bytes_total'], 'bytes', server_metadata),
+      sample.Sample('Server Response Bytes', deltas['app_response_bytes_total'], 'bytes', server_metadata),
+      # High-water mark since the instance started, not just this stage
+      sample.Sample('Server Max Concurrency', max_concurrency, 'requests', server_metadata),
+  ]
+  if requests > 0:
+    for metric, name in (('Server Time Per Request', 'app_request_duration_seconds_sum'),
+                         ('Server Busy Time Per Request', 'app_busy_seconds_total'),
+                         ('Server CPU Time Per Request', 'process_cpu_seconds_total'),
+                         ('Storage Time Per Request', 'app_request_storage_seconds_total')):
+      results.append(sample.Sample(metric, deltas[name] / requests * 1000, 'ms', server_metadata))
+  return results
+
+
+# Samples whose combined value is the sum over clients
+_SUMMED_METRICS = ['Requests Per Second', 'Objects Per Second', 'Partial Batches',
+                   'Total Errors', 'Completed Requests']
+# Same, for the '{Operation} ...' samples of scripts/mixed_workload.lua
+_OP_SUMMED_SUFFIXES = ['Requests', 'Errors', 'Requests Per Second']
+_CLIENT_CPU_METRICS = ['Client CPU Utilization', 'Client CPU Max Core Utilization']
+
+
+def _HistogramPercentile(histogram, percentile):
+  """Returns the smallest bucket of {ms: count} covering `percentile`."""
+  total = sum(histogram.values())
+  threshold = total * percentile / 100.0
+  seen = 0
+  for value in sorted(histogram):
+    seen += histogram[value]
+    if seen >= threshold:
+      return value
+  return max(histogram)
+
+
+def _AggregateClients(client_results, metadata):
+  """Combines the samples of concurrent clients into fleet-wide samples.
+
+  Throughput and counts are summed. Latency percentiles come from the merged
+  histogram when every client reported one; otherwise the worst client value
+  is used and tagged latency_aggregation=max.
+  """
+  results = []
+  by_metric = collections.defaultdict(list)
+  for client_samples in client_results:
+    for s in client_samples:
+      by_metric[s.metric].append(s)
+
+  for metric in _SUMMED_METRICS:
+    if by_metric[metric]:
+      results.append(sample.Sample(metric, sum(s.value for s in by_metric[metric]),
+                                   by_metric[metric][0].unit, metadata))
+
+  if by_metric['First Response Latency']:
+    results.append(sample.Sample(
+        'First Response Latency', min(s.value for s in by_metric['First Response Latency']),
+        'ms', metadata))
+  # Clients start together, so their series share offsets. Counts add up;
+  # per-interval latency takes the worst client.
+  for metric, unit in _TIMESERIES_COLUMNS:
+    series = by_metric[metric]
+    if not series:
+      continue
+    combined = {}
+    for s in series:
+      for timestamp, value in zip(json.loads(s.metadata['timestamps']),
+                                  json.loads(s.metadata['values'])):
+        if value is None:
+          combined.setdefault(timestamp, None)
+        elif unit == 'ms':
+          combined[timestamp] = max(value, combined.get(timestamp) or value)
+        else:
+          combined[timestamp] = (combined.get(timestamp) or 0) + value
+    timestamps = sorted(combined)
+    results.append(_TimeSeriesSample(
+        metric, unit, timestamps, [combined[t] for t in timestamps],
+        series[0].metadata['interval'], metadata))
+
+  # The busiest client decides whether the load generator was the bottleneck
+  for metric in _CLIENT_CPU_METRICS:
+    if by_metric[metric]:
+      results.append(sample.Sample(metric, max(s.value for s in by_metric[metric]), '%',
+                                   dict(metadata, cpu_aggregation='max')))
+
+  results.extend(_AggregateLatency(by_metric, '', len(client_results), metadata))
 
-  # Check return code BEFORE parsing
-  if retcode != 0:
-      logging.error('wrk command failed with return code %d', retcode)
-      # Return empty results on failure
-      return []
-
-  # Parse wrk output (this is a basic example, needs more robust parsing)
-  metadata = {
-      'wrk_threads': FLAGS.wrk_num_threads,
-      'wrk_connections': FLAGS.wrk_num_conns,
-      'wrk_duration': FLAGS.wrk_duration,
-      'wrk_target_url': target_url,
-      'wrk_script': FLAGS.wrk_script_remote_path if FLAGS.wrk_script_local_path else 'None',
-      'command_return_code': retcode,
-      'wrk_custom_flags': FLAGS.wrk_flags or 'None'
-  }
+  # Per-operation samples of mixed workloads ('Read ...', 'Write ...')
+  operations = sorted({s.metadata['wrk_operation'] for samples in by_metric.values()
+                       for s in samples if 'wrk_operation' in s.metadata})
+  for op in operations:
+    op_label = op.capitalize()
+    op_metadata = dict(metadata, wrk_operation=op)
+    for suffix in _OP_SUMMED_SUFFIXES:
+      op_samples = by_metric[f'{op_label} {suffix}']
+      if op_samples:
+        results.append(sample.Sample(f'{op_label} {suffix}', sum(s.value for s in op_samples),
+                                     op_samples[0].unit, op_metadata))
+    results.extend(_AggregateLatency(by_metric, f'{op_label} ', len(client_results), op_metadata))
+  return results
+
+
+def _AggregateLatency(by_metric, prefix, client_count, metadata):
+  """Combines '{prefix}Latency ...' samples of all clients.
+
+  Percentiles come from the merged histogram when every client reported one;
+  otherwise the worst client value is used and tagged latency_aggregation=max.
+  """
+  results = []
+  p50_samples = by_metric[f'{prefix}Latency p50']
+  corrected = bool(p50_samples) and all(s.metadata.get('latency_corrected') for s in p50_samples)
+  latency_metadata = dict(metadata, latency_corrected=True) if corrected else metadata
+  histograms = by_metric[f'{prefix}Latency Histogram']
+  if histograms and len(histograms) == client_count:
+    merged = collections.Counter()
+    for s in histograms:
+      for value, count in json.loads(s.metadata['histogram']).items():
+        merged[float(value)] += count
+    merged_metadata = dict(latency_metadata, latency_aggregation='merged_histogram')
+    for name, percentile in _PERCENTILES:
+      results.append(sample.Sample(f'{prefix}Latency {name}', _HistogramPercentile(merged, percentile),
+                                   'ms', merged_metadata))
+    total = sum(merged.values())
+    # Mean and stdev combine the clients' own values weighted by their request
+    # counts (the histogram sample values), so they agree with what each client
+    # reported; bucket values are only used when a client lacks them.
+    counts = [s.value for s in histograms]
+    means = [s.value for s in by_metric[f'{prefix}Latency Mean']]
+    stdevs = [s.value for s in by_metric[f'{prefix}Latency Stdev']]
+    if len(means) == client_count and sum(counts):
+      mean = sum(m * n for m, n in zip(means, counts)) / sum(counts)
+    else:
+      mean = sum(value * count for value, count in merged.items()) / total
+    if len(means) == len(stdevs) == client_count and sum(counts):
+      variance = sum(n * (sd ** 2 + (m - mean) ** 2)
+                     for m, sd, n in zip(means, stdevs, counts)) / sum(counts)
+    else:
+      variance = sum(count * (value - mean) ** 2 for value, count in merged.items()) / total
+    results.append(sample.Sample(f'{prefix}Latency Mean', mean, 'ms', merged_metadata))
+    results.append(sample.Sample(f'{prefix}Latency Stdev', math.sqrt(variance), 'ms', merged_metadata))
+    for name, combine in (('Min', min), ('Max', max)):
+      if by_metric[f'{prefix}Latency {name}']:
+        results.append(sample.Sample(
+            f'{prefix}Latency {name}', combine(s.value for s in by_metric[f'{prefix}Latency {name}']),
+            'ms', merged_metadata))
+    results.append(_HistogramSample(dict(merged), merged_metadata, f'{prefix}Latency Histogram'))
+  else:
+    max_metadata = dict(latency_metadata, latency_aggregation='max')
+    for name, _ in _PERCENTILES:
+      client_values = [s.value for s in by_metric[f'{prefix}Latency {name}']]
+      if client_values:
+        results.append(sample.Sample(f'{prefix}Latency {name}', max(client_values), 'ms', max_metadata))
+  return results
+
+
+def _ParseLuaPercentiles(parse_and_add_sample, results, metadata, stdout):
+  # Parse the metrics printed by the Lua done() function
+  parse_and_add_sample('Latency p50', r'PKB_METRIC_Latency_p50:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+  parse_and_add_sample('Latency p90', r'PKB_METRIC_Latency_p90:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+  parse_and_add_sample('Latency p95', r'PKB_METRIC_Latency_p95:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+  parse_and_add_sample('Latency p99', r'PKB_METRIC_Latency_p99:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+  parse_and_add_sample('Latency p99.9', r'PKB_METRIC_Latency_p999:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+
+
+# (sample name suffix, percentile) pairs reported for every run
+_PERCENTILES = [('p50', 50.0), ('p90', 90.0), ('p95', 95.0), ('p99', 99.0),
+                ('p99.9', 99.9)]
+
+_LATENCY_UNITS_MS = {'us': 0.001, 'ms': 1.0, 's': 1000.0, 'm': 60000.0}
+
+
+def _ParseHdrPercentiles(stdout):
+  """Returns {percentile: ms} from wrk2's "Latency Distribution" block."""
+  section = stdout.split('Latency Distribution', 1)
+  if len(section) < 2:
+    return {}
+  # Stop before the detailed spectrum and any --u_latency (uncorrected) block.
+  section = re.split(r'Detailed Percentile|Latency Distribution', section[1])[0]
+  percentiles = {}
+  for match in re.finditer(r'^\s*([\d.]+)%\s+([\d.]+)(us|ms|s|m)\s*$',
+                           section, re.MULTILINE):
+    percentiles[float(match.group(1))] = (
+        float(match.group(2)) * _LATENCY_UNITS_MS[match.group(3)])
+  return percentiles
+
+
+def _ParseHdrSpectrum(stdout):
+  """Returns [(ms, quantile, total_count)] rows of wrk2's first "Detailed Percentile spectrum"."""
+  section = stdout.split('Detailed Percentile spectrum', 1)
+  if len(section) < 2:
+    return []
+  section = section[1].split('#[Mean', 1)[0]
+  return [(float(value), float(quantile), int(count)) for value, quantile, count in re.findall(
+      r'^\s*([\d.]+)\s+([\d.]+)\s+(\d+)\s+(?:[\d.]+|inf)\s*$', section, re.MULTILINE)]
+
+
+def _CorrectedPercentiles(stdout):
+  """Returns {percentile: ms} for _PERCENTILES from wrk2's corrected histogram.
+
+  The summary block only lists fixed percentiles (no p95), so values are read
+  from the full spectrum when it is present.
+  """
+  spectrum = _ParseHdrSpectrum(stdout)
+  if not spectrum:
+    return _ParseHdrPercentiles(stdout)
+  percentiles = {}
+  for _, percentile in _PERCENTILES:
+    quantile = round(percentile / 100.0, 6)
+    percentiles[percentile] = next(
+        (value for value, q, _ in spectrum if q >= quantile), spectrum[-1][0])
+  return percentiles
+
+
+def _ParseLuaHistogram(stdout):
+  """Returns {ms: count} from the PKB_METRIC_Latency_Histogram_us line."""
+  match = re.search(r'PKB_METRIC_Latency_Histogram_us:\s*([\d:,]*)', stdout)
+  if not match:
+    return {}
+  histogram = collections.Counter()
+  for pair in filter(None, match.group(1).split(',')):
+    value_us, count = pair.split(':')
+    histogram[int(value_us) / 1000.0] += int(count)
+  return dict(histogram)
+
+
+def _SpectrumHistogram(stdout):
+  """Returns {ms: count} rebuilt from the cumulative counts of wrk2's spectrum."""
+  histogram = collections.Counter()
+  previous = 0
+  for value, _, total in _ParseHdrSpectrum(stdout):
+    if total > previous:
+      histogram[value] += total - previous
+      previous = total
+  return dict(histogram)
+
+
+def _HistogramSample(histogram, metadata, metric='Latency Histogram'):
+  """Stores a latency distribution as one sample, histogram JSON in metadata.
+
+  The value is the number of recorded requests; the 'histogram' metadata maps
+  bucket latency in ms (as a string, since it is JSON) to request count.
+  """
+  return sample.Sample(
+      metric, sum(histogram.values()), 'requests',
+      dict(metadata, histogram=json.dumps(
+          {f'{value:g}': count for value, count in sorted(histogram.items())})))
+
+
+# Series printed per interval by upload_script.lua, in column order after the
+# offset: (metric, unit). Latency columns hold -1 for intervals without data.
+_TIMESERIES_COLUMNS = [('Requests Per Second Time Series', 'req/s'),
+                       ('Errors Time Series', 'count'),
+                       ('Latency p50 Time Series', 'ms'),
+                       ('Latency p90 Time Series', 'ms'),
+                       ('Latency p99 Time Series', 'ms')]
+
+
+def _TimeSeriesSample(metric, unit, timestamps, values, interval, metadata):
+  """Stores one series as a sample; values/timestamps are JSON lists in metadata.
+
+  timestamps are seconds since the first request of the stage. The sample value
+  is the peak of the series (None entries, i.e. intervals without data, skipped).
+  """
+  known = [v for v in values if v is not None]
+  return sample.Sample(metric, max(known) if known else 0, unit, dict(
+      metadata, interval=interval, timestamps=json.dumps(timestamps),
+      values=json.dumps(values)))
+
+
+def _ParseTimeSeries(stdout, metadata):
+  """Parses the PKB_METRIC_Timeseries lines into time-series samples."""
+  rows = re.findall(r'PKB_METRIC_Timeseries:\s*([\d.,-]+)', stdout)
+  if not rows:
+    return []
+  interval_match = re.search(r'PKB_METRIC_Timeseries_Interval:\s*(\d+)', stdout)
+  interval = int(interval_match.group(1)) if interval_match else 1
+  timestamps = []
+  columns = [[] for _ in _TIMESERIES_COLUMNS]
+  for row in rows:
+    fields = [float(field) for field in row.split(',')]
+    timestamps.append(int(fields[0]))
+    requests, errors = fields[1], fields[2]
+    columns[0].append(requests / interval)
+    columns[1].append(int(errors))
+    for column, value in zip(columns[2:], fields[3:]):
+      column.append(value if value >= 0 else None)
+  return [_TimeSeriesSample(metric, unit, timestamps, values, interval, metadata)
+          for (metric, unit), values in zip(_TIMESERIES_COLUMNS, columns)]
+
+
+def _ParseClientCpu(stdout, metadata):
+  """Returns the load generator's CPU utilization samples from /proc/stat snapshots.
+
+  'Client CPU Utilization' averages all cores; 'Client CPU Max Core Utilization'
+  is the busiest core, which saturates first since each wrk thread is one core.
+  Values near 100% mean the client, not the service, limits throughput.
+  """
+  snapshots = {}
+  for marker, name, counters in re.findall(r'PKB_CPU_(START|END) (cpu\d*) ([\d ]+)', stdout):
+    snapshots.setdefault(marker, {})[name] = [int(v) for v in counters.split()]
+  start, end = snapshots.get('START', {}), snapshots.get('END', {})
+
+  utilization = {}
+  for name in start.keys() & end.keys():
+    # user nice system idle iowait irq softirq steal; guest time is already in user
+    delta = [e - s for s, e in zip(start[name][:8], end[name][:8])]
+    total = sum(delta)
+    if total > 0:
+      utilization[name] = 100.0 * (total - delta[3] - delta[4]) / total
+  if 'cpu' not in utilization:
+    return []
+  cores = [value for name, value in utilization.items() if name != 'cpu']
+  cpu_metadata = dict(metadata, client_cpu_count=len(cores))
+  results = [sample.Sample('Client CPU Utilization', utilization['cpu'], '%', cpu_metadata)]
+  if cores:
+    results.append(sample.Sample('Client CPU Max Core Utilization', max(cores), '%', cpu_metadata))
+  return results
+
+
+# Latency columns of a PKB_METRIC_Op line, after requests, errors and req/s
+_OP_LATENCY_COLUMNS = ['p50', 'p90', 'p95', 'p99', 'p99.9', 'Mean']
+
+
+def _ParseOperations(stdout, metadata):
+  """Parses the per-operation lines of scripts/mixed_workload.lua.
+
+  Samples are named '{Operation} ...' (e.g. 'Read Latency p99') and tagged with
+  wrk_operation, so they never mix with the overall samples of the run.
+  """
+  results = []
+  histograms = {}
+  for op, pairs in re.findall(r'PKB_METRIC_Op_Histogram_us:\s*(\w+)\s+([\d:,]*)', stdout):
+    histogram = collections.Counter()
+    for pair in filter(None, pairs.split(',')):
+      value_us, count = pair.split(':')
+      histogram[int(value_us) / 1000.0] += int(count)
+    histograms[op] = dict(histogram)
+  for row in re.findall(r'PKB_METRIC_Op:\s*(\S+)', stdout):
+    fields = row.split(',')
+    op = fields[0]
+    label = op.capitalize()
+    op_metadata = dict(metadata, wrk_operation=op)
+    results.append(sample.Sample(f'{label} Requests', int(fields[1]), 'requests', op_metadata))
+    results.append(sample.Sample(f'{label} Errors', int(fields[2]), 'count', op_metadata))
+    results.append(sample.Sample(f'{label} Requests Per Second', float(fields[3]), 'req/s', op_metadata))
+    for name, value in zip(_OP_LATENCY_COLUMNS, fields[4:]):
+      results.append(sample.Sample(f'{label} Latency {name}', float(value), 'ms', op_metadata))
+    if histograms.get(op):
+      results.append(_HistogramSample(histograms[op], op_metadata, f'{label} Latency Histogram'))
+  return results
+
+
+def _ParseOutput(stdout, metadata):
+  """Parses the samples of one wrk invocation."""
+  results = []
 
   def parse_and_add_sample(metric_name, regex_pattern, unit, results_list, metadata_dict, stdout_text):
     match = re.search(regex_pattern, stdout_text)
@@ -142,19 +729,66 @@ def Run(benchmark_spec: bm_spec.BenchmarkSpec):
     else:
         logging.warning(f"Could not find metric '{metric_name}' in wrk output.")
 
+  # wrk2's HdrHistogram already corrects for coordinated omission, so in
+  # open-loop mode it replaces the percentiles printed by the Lua script.
+  corrected = _CorrectedPercentiles(stdout) if metadata.get('wrk_open_loop') else {}
+  if corrected:
+    for name, percentile in _PERCENTILES:
+      if percentile in corrected:
+        results.append(sample.Sample(f'Latency {name}', corrected[percentile], 'ms',
+                                     dict(metadata, latency_corrected=True)))
+  else:
+    _ParseLuaPercentiles(parse_and_add_sample, results, metadata, stdout)
 
-  # Parse the metrics printed by the Lua done() function
-  parse_and_add_sample('Latency p50', r'PKB_METRIC_Latency_p50:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
-  parse_and_add_sample('Latency p90', r'PKB_METRIC_Latency_p90:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
-  parse_and_add_sample('Latency p95', r'PKB_METRIC_Latency_p95:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
-  parse_and_add_sample('Latency p99', r'PKB_METRIC_Latency_p99:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
-  parse_and_add_sample('Latency p99.9', r'PKB_METRIC_Latency_p999:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+  # Full distribution plus summary stats, so reports can derive any percentile
+  # and merge runs. Open-loop runs use wrk2's corrected histogram again.
+  summary_match = re.search(r'#\[Mean\s*=\s*([\d.]+), StdDeviation\s*=\s*([\d.]+)\]'
+                            r'\s*#\[Max\s*=\s*([\d.]+)', stdout)
+  if corrected and summary_match:
+    histogram = _SpectrumHistogram(stdout)
+    corrected_metadata = dict(metadata, latency_corrected=True)
+    for name, value in zip(('Mean', 'Stdev', 'Max'), summary_match.groups()):
+      results.append(sample.Sample(f'Latency {name}', float(value), 'ms', corrected_metadata))
+    if histogram:
+      results.append(_HistogramSample(histogram, corrected_metadata))
+  elif 'PKB_METRIC_Latency_Histogram_us' in stdout:
+    for name in ('Mean', 'Stdev', 'Min', 'Max'):
+      parse_and_add_sample(f'Latency {name}', rf'PKB_METRIC_Latency_{name}:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+    histogram = _ParseLuaHistogram(stdout)
+    if histogram:
+      results.append(_HistogramSample(histogram, metadata))
+
+  # Per-interval series and time to first response (cold start), when the Lua
+  # script records them
+  if 'PKB_METRIC_First_Response_Latency' in stdout:
+    parse_and_add_sample('First Response Latency', r'PKB_METRIC_First_Response_Latency:\s+([\d.]+)\s+ms', 'ms', results, metadata, stdout)
+  results.extend(_ParseTimeSeries(stdout, metadata))
+  results.extend(_ParseOperations(stdout, metadata))
+  results.extend(_ParseClientCpu(stdout, metadata))
+
+  # Only printed by scripts/batch_upload_script.lua; absent for single-file runs
+  if 'PKB_METRIC_Objects_Per_Second' in stdout:
+    parse_and_add_sample('Objects Per Second', r'PKB_METRIC_Objects_Per_Second:\s+([\d.]+)', 'objects/s', results, metadata, stdout)
+    parse_and_add_sample('Batch Size', r'PKB_METRIC_Batch_Size:\s+(\d+)', 'objects', results, metadata, stdout)
+    parse_and_add_sample('Partial Batches', r'PKB_METRIC_Partial_Batches:\s+(\d+)', 'requests', results, metadata, stdout)
+
+  # Requests the script excludes from the measurement (the populate uploads of
+  # scripts/mixed_workload.lua) are taken out of wrk's totals below.
+  excluded_match = re.search(r'PKB_METRIC_Excluded_Requests:\s+(\d+)', stdout)
+  excluded_errors_match = re.search(r'PKB_METRIC_Excluded_Errors:\s+(\d+)', stdout)
+  excluded = int(excluded_match.group(1)) if excluded_match else 0
+  excluded_errors = int(excluded_errors_match.group(1)) if excluded_errors_match else 0
+  requests_match = re.search(r'(\d+)\s+requests in', stdout)
+  completed = int(requests_match.group(1)) if requests_match else None
 
   # You might want to keep the overall RPS and Error count from wrk's default output too
   # Adjust the regex based on wrk's standard output format
   rps_match = re.search(r'Requests/sec:\s+([\d.]+)', stdout)
   if rps_match:
-      results.append(sample.Sample('Requests Per Second', float(rps_match.group(1)), 'req/s', metadata))
+      rps = float(rps_match.group(1))
+      if excluded and completed:
+          rps *= max(0, completed - excluded) / completed
+      results.append(sample.Sample('Requests Per Second', rps, 'req/s', metadata))
 
   errors_match = re.search(r'Socket errors: connect (\d+), read (\d+), write (\d+), timeout (\d+)', stdout)
   status_errors_match = re.search(r'Non-2xx or 3xx responses:\s+(\d+)', stdout) # Example for status errors
@@ -164,12 +798,11 @@ def Run(benchmark_spec: bm_spec.BenchmarkSpec):
   if status_errors_match:
       total_errors += int(status_errors_match.group(1))
   # Add a consolidated error sample
-  results.append(sample.Sample('Total Errors', total_errors, 'count', metadata))
+  results.append(sample.Sample('Total Errors', max(0, total_errors - excluded_errors), 'count', metadata))
 
   # Add completed requests if needed
-  requests_match = re.search(r'(\d+)\s+requests in', stdout)
-  if requests_match:
-      results.append(sample.Sample('Completed Requests', int(requests_match.group(1)), 'requests', metadata))
+  if completed is not None:
+      results.append(sample.Sample('Completed Requests', max(0, completed - excluded), 'requests', metadata))
 
   return results # Return the list containing all parsed samples
 
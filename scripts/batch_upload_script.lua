@@ -0,0 +1,104 @@
+-- scripts/batch_upload_script.lua
+-- Lua script for wrk to POST several files per request to /upload/batch.
+-- Reads 'sample.jpg' from the current directory on the client VM and sends it
+-- BATCH_SIZE times per request as separate multipart parts (field "files").
+-- done() prints the same latency percentiles as upload_script.lua plus the
+-- object rate, so objects/sec can be compared with the single-file path.
+
+local file_path = "sample.jpg" -- Relative path on the client VM
+-- Parts per request. Override locally with `WRK_BATCH_SIZE=25 wrk ...`.
+local batch_size = tonumber(os.getenv("WRK_BATCH_SIZE") or "") or 10
+local file_content
+local file = io.open(file_path, "rb")
+if not file then
+  file = io.open("./" .. file_path, "rb")
+end
+
+if not file then
+  print("Error: Could not open file: " .. file_path .. " in current dir or ./")
+  return wrk.format("GET", "/error-file-not-found")
+else
+  file_content = file:read("*a")
+  file:close()
+end
+
+local function generate_boundary()
+    return "---------------------------" .. string.format("%x", os.time()) .. string.format("%x", math.random(0, 0xFFFFFFFF))
+end
+
+request = function()
+  local boundary = generate_boundary()
+  local body = {}
+
+  -- Distinct object names per part so the concurrent writes don't target the same object
+  for i = 1, batch_size do
+    table.insert(body, "--" .. boundary .. "\r\n")
+    table.insert(body, "Content-Disposition: form-data; name=\"files\"; filename=\"batch_" .. i .. "_" .. file_path .. "\"\r\n")
+    table.insert(body, "Content-Type: image/jpeg\r\n\r\n")
+    table.insert(body, file_content .. "\r\n")
+  end
+  table.insert(body, "--" .. boundary .. "--\r\n")
+  body = table.concat(body)
+
+  wrk.headers["Content-Type"] = "multipart/form-data; boundary=" .. boundary
+
+  -- The URL passed to wrk should point at /upload/batch
+  return wrk.format("POST", nil, nil, body)
+end
+
+-- print_latency_histogram(), shared with upload_script.lua
+for _, path in ipairs({"latency_histogram.lua", "scripts/latency_histogram.lua"}) do
+  local f = io.open(path, "r")
+  if f then
+    f:close()
+    dofile(path)
+    break
+  end
+end
+
+-- Objects stored by this thread, read by done() through thread:get(). A 200
+-- stores the whole batch; a 207 only the files its body counts as "stored".
+stored_objects = 0
+partial_batches = 0
+
+local threads = {}
+setup = function(thread)
+  table.insert(threads, thread)
+end
+
+response = function(status, headers, body)
+  if status == 200 then
+    stored_objects = stored_objects + batch_size
+  elseif status == 207 then
+    partial_batches = partial_batches + 1
+    stored_objects = stored_objects + (tonumber(body:match('"stored"%s*:%s*(%d+)')) or 0)
+  end
+end
+
+done = function(summary, latency, requests)
+  -- Latency values from wrk are in microseconds; summary.duration too.
+  print(string.format("PKB_METRIC_Latency_p50: %.3f ms", latency:percentile(50.0) / 1000.0))
+  print(string.format("PKB_METRIC_Latency_p90: %.3f ms", latency:percentile(90.0) / 1000.0))
+  print(string.format("PKB_METRIC_Latency_p95: %.3f ms", latency:percentile(95.0) / 1000.0))
+  print(string.format("PKB_METRIC_Latency_p99: %.3f ms", latency:percentile(99.0) / 1000.0))
+  print(string.format("PKB_METRIC_Latency_p999: %.3f ms", latency:percentile(99.9) / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Mean: %.3f ms", latency.mean / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Stdev: %.3f ms", latency.stdev / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Min: %.3f ms", latency.min / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Max: %.3f ms", latency.max / 1000.0))
+  if print_latency_histogram then
+    print_latency_histogram(latency, summary.requests)
+  end
+
+  -- Only objects the app reported as stored count; failed requests and the
+  -- failed files of partial (207) batches do not
+  local stored, partial = 0, 0
+  for _, thread in ipairs(threads) do
+    stored = stored + (thread:get("stored_objects") or 0)
+    partial = partial + (thread:get("partial_batches") or 0)
+  end
+  local duration_sec = summary.duration / 1000000.0
+  print(string.format("PKB_METRIC_Batch_Size: %d", batch_size))
+  print(string.format("PKB_METRIC_Partial_Batches: %d", partial))
+  print(string.format("PKB_METRIC_Objects_Per_Second: %.2f", stored / duration_sec))
+end
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# scripts/cold_start_benchmark.py
+# Measures the app's local cold start: time from launching the server process (or
+# container) to its first successful response, repeated over fresh starts.
+#
+#   cold_start_benchmark.py [--runs 10] [--variant NAME:KEY=VALUE,KEY=VALUE ...]
+#                           [--image IMAGE] [--path /] [--out cold_start.json]
+#
+# Each variant is a set of environment overrides, e.g.
+#   --variant baseline: --variant no-prewarm:STORAGE_PREWARM=0 --variant 2-workers:WEB_CONCURRENCY=2
+# Without --image the server is app/serve.py on this machine; with it, each start
+# is a `docker run` of the image, which includes container creation. The app uses
+# the in-memory storage backend unless a variant sets STORAGE_BACKEND.
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, 'app')
+
+# Environment of every start unless a variant overrides it
+BASE_ENV = {'STORAGE_BACKEND': 'memory', 'ACCESS_LOG': '0'}
+
+# --- Helpers ---
+def parse_variant(text):
+    """'name:KEY=VALUE,KEY=VALUE' -> (name, {KEY: VALUE})."""
+    name, _, assignments = text.partition(':')
+    env = {}
+    for item in filter(None, assignments.split(',')):
+        key, sep, value = item.partition('=')
+        if not sep:
+            sys.exit(f"Error: Expected KEY=VALUE in variant {text!r}, got {item!r}")
+        env[key] = value
+    return name or 'default', env
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def wait_for_response(url, proc, timeout):
+    """Polls url until it answers 2xx; returns the perf_counter time of that
+    response, or None if the process exited or the timeout passed first."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                response.read()
+                if 200 <= response.status < 300:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.002)
+    return None
+
+# --- Starts ---
+def start_local(env, port, log):
+    return subprocess.Popen([sys.executable, 'serve.py'], cwd=APP_DIR,
+                            env={**os.environ, **env, 'PORT': str(port)},
+                            stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+def start_container(image, env, port, name, log):
+    cmd = ['docker', 'run', '--rm', '--name', name, '-p', f'127.0.0.1:{port}:8080']
+    for key, value in env.items():
+        cmd += ['-e', f'{key}={value}']
+    return subprocess.Popen(cmd + [image], stdout=log, stderr=subprocess.STDOUT)
+
+def stop(proc, container=None):
+    if container:
+        subprocess.run(['docker', 'rm', '-f', container], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+    elif proc.poll() is None:
+        os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def measure(env, args, run_index):
+    """Seconds from launch to the first successful response of one fresh start."""
+    port = free_port()
+    container = f'cold-start-{os.getpid()}-{run_index}' if args.image else None
+    with tempfile.TemporaryFile() as log:
+        launched = time.perf_counter()
+        if args.image:
+            proc = start_container(args.image, env, port, container, log)
+        else:
+            proc = start_local(env, port, log)
+        try:
+            ready = wait_for_response(f'http://127.0.0.1:{port}{args.path}', proc, args.timeout)
+        finally:
+            stop(proc, container)
+        if ready is None:
+            log.seek(0)
+            output = log.read().decode(errors='replace').strip().splitlines()
+            print(f"Warning: Start {run_index} did not answer within {args.timeout}s"
+                  f"{': ' + output[-1] if output else ''}")
+            return None
+    return ready - launched
+
+# --- CLI ---
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure process start to first successful response of the app.')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh starts per variant')
+    parser.add_argument('--variant', action='append', default=[],
+                        help='NAME:KEY=VALUE,... environment overrides (repeatable)')
+    parser.add_argument('--image', help='Start this container image instead of app/serve.py')
+    parser.add_argument('--path', default='/', help='Path requested until it succeeds')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for one start')
+    parser.add_argument('--out', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for name, overrides in map(parse_variant, args.variant or ['default:']):
+        env = {**BASE_ENV, **overrides}
+        # Discarded start: warms the OS page cache like a long-lived host would be
+        measure(env, args, -1)
+        times = [t for t in (measure(env, args, i) for i in range(args.runs)) if t is not None]
+        entry = {'variant': name, 'env': overrides, 'runs': args.runs, 'successful_runs': len(times)}
+        if times:
+            ms = [t * 1000 for t in times]
+            entry.update({
+                'min_ms': round(min(ms), 1),
+                'median_ms': round(statistics.median(ms), 1),
+                'p90_ms': round(percentile(ms, 0.9), 1),
+                'max_ms': round(max(ms), 1),
+                'mean_ms': round(statistics.mean(ms), 1),
+            })
+        results.append(entry)
+
+    print(f"{'variant':<20} {'runs':>5} {'min':>9} {'median':>9} {'p90':>9} {'max':>9}  (ms to first response)")
+    for r in results:
+        if not r['successful_runs']:
+            print(f"{r['variant']:<20} {0:>5}  no successful starts")
+            continue
+        print(f"{r['variant']:<20} {r['successful_runs']:>5} {r['min_ms']:>9.1f} {r['median_ms']:>9.1f} "
+              f"{r['p90_ms']:>9.1f} {r['max_ms']:>9.1f}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'image': args.image, 'path': args.path, 'results': results}, f, indent=2)
+        print(f"Wrote {args.out}")
+    if not all(r['successful_runs'] for r in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
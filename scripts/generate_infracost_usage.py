@@ -1,106 +1,271 @@
 #!/usr/bin/env python3
 # scripts/generate_infracost_usage.py
-# Reads PKB results and generates an Infracost usage YAML file.
+# Reads PKB results, models Cloud Run billable instance time, and generates an
+# Infracost usage YAML file for a projected month plus a cost model JSON file.
+#
+#   generate_infracost_usage.py pkb_results.json infracost_usage.yml [upload_bytes] \
+#       [traffic_profile.yml] [cost_model.json]
+#
+# The traffic profile (optional) describes the month to project:
+#   hourly_rps: [5, 5, 3, 2, 2, 4, 20, 60, ...]  # cycled over the month's hours
+#   hours_per_month: 730
+#   pricing: {vcpu_second_usd: 0.000024, ...}    # overrides of PRICING below
+# Without one, the measured mean throughput is assumed around the clock.
 
 import json
 import os
 import yaml # Requires PyYAML
 import sys
 import math
+from pkb_results import PkbResults
 
 # --- Configuration & Inputs ---
 pkb_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), 'pkb_results.json')
 usage_file = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.getcwd(), 'infracost_usage.yml')
-sample_jpg_size_bytes = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+sample_jpg_size_bytes = int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] else 0
+profile_file = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] else os.getenv('TRAFFIC_PROFILE')
+cost_model_file = sys.argv[5] if len(sys.argv) > 5 else os.path.join(os.getcwd(), 'cost_model.json')
 
 # Get config needed for calculation (provide defaults)
 cpu_cores = float(os.getenv('TF_VAR_cpu_cores', '1.0'))
 memory_mb = float(os.getenv('TF_VAR_memory_mb', '512.0'))
 memory_gib = memory_mb / 1024.0
+concurrency_limit = int(os.getenv('TF_VAR_concurrency_limit', '80'))
+min_instances = int(os.getenv('TF_VAR_min_instances', '0'))
+max_instances = int(os.getenv('TF_VAR_max_instances', '10'))
 
-# --- Helper to extract PKB metric ---
-def get_pkb_metric(samples, metric_name, default=0.0):
-    for sample in samples:
-        if sample.get('metric') == metric_name:
-            val = sample.get('value')
-            # Return default if value is None or not a number or NaN/Inf
-            return val if isinstance(val, (int, float)) and not math.isnan(val) and not math.isinf(val) else default
-    return default
+# us-central1 (tier 1) list prices for request-based billing (cpu_idle = true in
+# infra/main.tf), Cloud Storage Standard and the external load balancer.
+PRICING = {
+    'vcpu_second_usd': 0.000024,
+    'gib_second_usd': 0.0000025,
+    'idle_vcpu_second_usd': 0.0000025,    # Min instances while idle
+    'idle_gib_second_usd': 0.0000025,
+    'million_requests_usd': 0.40,
+    'class_a_thousand_ops_usd': 0.005,    # One object write per uploaded file
+    'lb_forwarding_rule_hourly_usd': 0.025,
+    'lb_data_processed_gb_usd': 0.008,
+}
+# Share of the concurrency limit the autoscaler aims to fill before adding instances
+TARGET_CONCURRENCY_UTILIZATION = 0.6
+
+# --- Instance Model ---
+def simulate_interval(rps, server_seconds, seconds):
+    """Billable instance time of `seconds` at a steady `rps`.
+
+    Little's law gives the requests in flight (rps x server time); the autoscaler
+    runs enough instances to hold each at TARGET_CONCURRENCY_UTILIZATION of the
+    concurrency limit, within [min_instances, max_instances]. With Poisson
+    arrivals an instance holding L requests on average has at least one in flight
+    (and is billed) 1 - exp(-L) of the time; min instances are billed at the idle
+    rate for the rest. Returns (instances, active_sec, idle_sec, saturated).
+    """
+    in_flight = rps * server_seconds
+    wanted = math.ceil(in_flight / (concurrency_limit * TARGET_CONCURRENCY_UTILIZATION)) if rps > 0 else 0
+    instances = min(max(wanted, min_instances, 1 if rps > 0 else 0), max_instances)
+    if instances == 0:
+        return 0, 0.0, 0.0, False
+    busy_fraction = 1 - math.exp(-in_flight / instances)
+    active = instances * busy_fraction * seconds
+    idle = min(min_instances, instances) * (1 - busy_fraction) * seconds
+    saturated = in_flight > instances * concurrency_limit
+    return instances, active, idle, saturated
+
+def instance_cost(active_sec, idle_sec):
+    return (active_sec * (cpu_cores * PRICING['vcpu_second_usd'] + memory_gib * PRICING['gib_second_usd'])
+            + idle_sec * (cpu_cores * PRICING['idle_vcpu_second_usd'] + memory_gib * PRICING['idle_gib_second_usd']))
 
 # --- Load PKB Data ---
-pkb_samples = []
 try:
-    with open(pkb_file, 'r') as f:
-        for line in f:
-            try:
-                pkb_samples.append(json.loads(line))
-            except json.JSONDecodeError:
-                print(f"Warning: Skipping invalid JSON line in {pkb_file}: {line.strip()}")
+    pkb_results = PkbResults.load(pkb_file)
 except FileNotFoundError:
     print(f"Error: PKB file {pkb_file} not found. Cannot generate usage.")
     sys.exit(1) # Exit if PKB data is missing
 
-if not pkb_samples:
+if not pkb_results:
     print(f"Error: No valid samples found in {pkb_file}. Cannot generate usage.")
     sys.exit(1)
 
+profile = {}
+if profile_file:
+    try:
+        with open(profile_file) as f:
+            profile = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"Error: Could not read traffic profile {profile_file}: {e}")
+        sys.exit(1)
+unknown_prices = set(profile.get('pricing', {})) - set(PRICING)
+if unknown_prices:
+    print(f"Error: Unknown pricing keys {sorted(unknown_prices)}; expected {sorted(PRICING)}")
+    sys.exit(1)
+PRICING.update(profile.get('pricing', {}))
+
 # --- Extract Key Metrics from PKB ---
 # Use Completed Requests as it represents successful operations
-completed_requests = get_pkb_metric(pkb_samples, 'Completed Requests', default=0)
-# Use p50 latency as a proxy for average request duration (in ms) - ACKNOWLEDGE LIMITATION
-p50_latency_ms = get_pkb_metric(pkb_samples, 'Latency p50', default=0.0)
-p50_latency_sec = p50_latency_ms / 1000.0 if p50_latency_ms > 0 else 0.0 # Avoid negative
-
-# --- Estimate Usage Based on Test Run ---
-# WARNING: Using p50 latency is a *very rough* proxy for server-side compute time.
-# WARNING: Extrapolating short test to monthly usage is inaccurate for totals.
-# We provide metrics Infracost *might* use based on common schemas.
-# Check Infracost GCP provider docs for exact keys if this fails.
-
-estimated_total_request_processing_seconds = completed_requests * p50_latency_sec
-estimated_total_vcpu_seconds = estimated_total_request_processing_seconds * cpu_cores
-estimated_total_gib_seconds = estimated_total_request_processing_seconds * memory_gib
-total_data_processed_gb = (completed_requests * sample_jpg_size_bytes) / (1024**3) if sample_jpg_size_bytes > 0 else 0
+completed_requests = pkb_results.metric('Completed Requests', 0)
+throughput_rps = pkb_results.metric('Requests Per Second', 0.0)
+# Server-side timing scraped from the app's /metrics endpoint by the wrk benchmark
+server_time_ms = pkb_results.metric('Server Time Per Request', 0.0)
+busy_time_ms = pkb_results.metric('Server Busy Time Per Request', 0.0)
+# Objects written per request (batch uploads store several)
+objects_per_request = pkb_results.metric('Batch Size', 1.0) or 1.0
+# Use p50 latency as a proxy for request duration (in ms) when the app reported no server time
+p50_latency_ms = pkb_results.metric('Latency p50', 0.0)
+
+if server_time_ms > 0:
+    server_time_basis = 'server_time_per_request'
+else:
+    # WARNING: Client p50 latency is a *very rough* proxy for server-side time
+    # (includes network). Used when no server metrics exist.
+    server_time_basis = 'client_p50_latency'
+    server_time_ms = p50_latency_ms
+server_seconds = server_time_ms / 1000.0
+
+# --- Simulate Instances Over the Run ---
+_, rps_series, interval_sec, series_labels = pkb_results.time_series('Requests Per Second Time Series')
+if not any(v is not None for v in rps_series):
+    # No time series: treat the run as one interval at its mean throughput
+    duration = completed_requests / throughput_rps if throughput_rps > 0 else 0.0
+    rps_series, interval_sec = [throughput_rps], duration
+run_instances = []
+run_active = run_idle = 0.0
+for rps in rps_series:
+    instances, active, idle, _ = simulate_interval(rps or 0.0, server_seconds, interval_sec)
+    run_instances.append(instances)
+    run_active += active
+    run_idle += idle
+
+# Measured busy time (all instances) checks the model: a ratio well above 1
+# means arrivals were burstier than Poisson and the projection is optimistic.
+measured_active = completed_requests * busy_time_ms / 1000.0 if busy_time_ms > 0 else None
+model_check = measured_active / run_active if measured_active and run_active > 0 else None
+
+# --- Project Monthly Cost ---
+hours_per_month = float(profile.get('hours_per_month', 730))
+measured_rps = sum(v for v in rps_series if v is not None) / max(1, sum(v is not None for v in rps_series))
+if profile.get('hourly_rps'):
+    hourly_rps = [float(v) for v in profile['hourly_rps']]
+    profile_description = f"{len(hourly_rps)}-hour profile from {profile_file}, cycled"
+else:
+    hourly_rps = [measured_rps]
+    profile_description = f"constant {measured_rps:.2f} req/s (measured mean), no profile supplied"
+
+month_requests = month_active = month_idle = 0.0
+saturated_hours = 0
+peak_instances = 0
+for hour in range(int(hours_per_month)):
+    rps = hourly_rps[hour % len(hourly_rps)]
+    instances, active, idle, saturated = simulate_interval(rps, server_seconds, 3600)
+    month_requests += rps * 3600
+    month_active += active
+    month_idle += idle
+    saturated_hours += saturated
+    peak_instances = max(peak_instances, instances)
+
+month_objects = month_requests * objects_per_request
+month_data_gb = month_objects * sample_jpg_size_bytes / (1024**3)
+cost_breakdown = {
+    'cloud_run_instances_usd': instance_cost(month_active, month_idle),
+    'cloud_run_requests_usd': month_requests / 1e6 * PRICING['million_requests_usd'],
+    'storage_operations_usd': month_objects / 1000 * PRICING['class_a_thousand_ops_usd'],
+    'load_balancer_usd': (hours_per_month * PRICING['lb_forwarding_rule_hourly_usd']
+                          + month_data_gb * PRICING['lb_data_processed_gb_usd']),
+}
+total_monthly = sum(cost_breakdown.values())
+cloud_run_monthly = cost_breakdown['cloud_run_instances_usd'] + cost_breakdown['cloud_run_requests_usd']
+
+cost_model = {
+    'cost_per_million_requests_usd': round(total_monthly / month_requests * 1e6, 4) if month_requests else None,
+    'cloud_run_cost_per_million_requests_usd': round(cloud_run_monthly / month_requests * 1e6, 4) if month_requests else None,
+    'projected_monthly': {
+        'requests': round(month_requests),
+        'cost_usd': round(total_monthly, 2),
+        'cost_breakdown_usd': {k: round(v, 2) for k, v in cost_breakdown.items()},
+        'active_instance_seconds': round(month_active),
+        'idle_instance_seconds': round(month_idle),
+        'vcpu_seconds': round(month_active * cpu_cores),
+        'memory_gib_seconds': round(month_active * memory_gib),
+        'peak_instances': peak_instances,
+        'saturated_hours': saturated_hours,
+    },
+    'benchmark_run': {
+        'completed_requests': completed_requests,
+        'interval_sec': interval_sec,
+        'simulated_instances': run_instances,
+        'simulated_active_instance_seconds': round(run_active, 3),
+        'simulated_idle_instance_seconds': round(run_idle, 3),
+        'measured_active_instance_seconds': round(measured_active, 3) if measured_active else None,
+        'measured_to_simulated_ratio': round(model_check, 4) if model_check else None,
+        'wrk_stage': series_labels.get('wrk_stage'),
+    },
+    'assumptions': {
+        'traffic_profile': profile_description,
+        'hours_per_month': hours_per_month,
+        'server_time_ms': round(server_time_ms, 3),
+        'server_time_basis': server_time_basis,
+        'billing': 'request-based (cpu_idle = true): instances billed while >= 1 request is in flight; '
+                   'min instances billed at idle rates otherwise; 100 ms rounding and free tier ignored',
+        'autoscaling': f'instances = ceil(in-flight / ({concurrency_limit} x {TARGET_CONCURRENCY_UTILIZATION})), '
+                       f'clamped to [{min_instances}, {max_instances}]',
+        'arrivals': 'Poisson within each interval (see benchmark_run.measured_to_simulated_ratio)',
+        'objects_per_request': objects_per_request,
+        'upload_bytes': sample_jpg_size_bytes,
+        'cpu_cores': cpu_cores,
+        'memory_gib': memory_gib,
+        'concurrency_limit': concurrency_limit,
+        'min_instances': min_instances,
+        'max_instances': max_instances,
+        'pricing': PRICING,
+    },
+}
+print(f"Projected month: {month_requests:,.0f} requests, ${total_monthly:,.2f} "
+      f"(${cost_model['cost_per_million_requests_usd']} per million requests, {profile_description})")
+if saturated_hours:
+    print(f"Warning: {saturated_hours} projected hours exceed max_instances x concurrency_limit.")
 
 # --- Define Usage Data ---
+# Usage describes the projected month, not the benchmark run itself.
 # Check Infracost docs for the definitive keys for your version!
 # Resource names MUST match your Terraform resource addresses
-# Adjust 'google_cloud_run_v2_service.image_saver_service', 
-# 'google_storage_bucket.images_bucket', 'google_compute_global_forwarding_rule.fw_rule', 
+# Adjust 'google_cloud_run_v2_service.image_saver_service',
+# 'google_storage_bucket.images_bucket', 'google_compute_global_forwarding_rule.fw_rule',
 # 'google_compute_target_http_proxy.http_proxy' if different in your infra/main.tf
 usage_data = {
     "version": "0.1",
     "resource_usage": {
         "google_cloud_run_v2_service.image_saver_service": {
-             # Provide *total* estimated compute seconds during the test period
-             # Infracost might use these directly OR via requests/duration_ms
-             "requests": completed_requests,
-             "request_duration_ms": p50_latency_ms,
+             # Infracost might use requests x request_duration_ms OR the totals below;
+             # the duration is the billable time per request, so both agree
+             "requests": round(month_requests),
+             "request_duration_ms": month_active / month_requests * 1000 if month_requests else 0.0,
              # Also provide estimated totals if the schema prefers it
              # These keys might vary based on Infracost version/GCP provider specifics
-             "vcpu_seconds": estimated_total_vcpu_seconds,
-             "memory_gib_seconds": estimated_total_gib_seconds,
+             "vcpu_seconds": month_active * cpu_cores,
+             "memory_gib_seconds": month_active * memory_gib,
         },
         "google_storage_bucket.images_bucket": {
             "storage_gb": 0.1,
-            "monthly_class_a_operations": completed_requests,
+            "monthly_class_a_operations": round(month_objects),
             "monthly_class_b_operations": 0,
         },
         "google_compute_global_forwarding_rule.fw_rule": {
-             "ingress_data_gb": total_data_processed_gb
+             "ingress_data_gb": month_data_gb
         },
         # ADDED usage key for proxy - check schema, 'data_processed_gb' is common
          "google_compute_target_http_proxy.http_proxy": {
-             "data_processed_gb": total_data_processed_gb
+             "data_processed_gb": month_data_gb
          }
     }
 }
 
-# --- Write YAML Usage File ---
+# --- Write YAML Usage File and Cost Model ---
 try:
     with open(usage_file, 'w') as f:
         yaml.dump(usage_data, f, sort_keys=False, default_flow_style=False)
     print(f"Successfully generated Infracost usage file: {usage_file}")
+    with open(cost_model_file, 'w') as f:
+        json.dump(cost_model, f, indent=2)
+    print(f"Successfully generated cost model: {cost_model_file}")
 except Exception as e:
-    print(f"Error writing usage file {usage_file}: {e}")
-    sys.exit(1) 
\ No newline at end of file
+    print(f"Error writing usage file {usage_file} or cost model {cost_model_file}: {e}")
+    sys.exit(1)
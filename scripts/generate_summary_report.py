@@ -4,8 +4,8 @@
 
 import json
 import os
-import math
 import sys
+from pkb_results import PkbResults
 
 # --- Configuration ---
 # Use command-line args or default paths
@@ -13,38 +13,60 @@ pkb_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), 'pkb_
 # *** Read from the new Infracost file (passed as 2nd arg) ***
 infracost_file = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.getcwd(), 'infracost_estimate_with_usage.json')
 output_file = sys.argv[3] if len(sys.argv) > 3 else os.path.join(os.getcwd(), 'summary_report.json')
+# Cost model written by generate_infracost_usage.py (optional)
+cost_model_file = sys.argv[4] if len(sys.argv) > 4 else os.path.join(os.getcwd(), 'cost_model.json')
 
 # --- Helper Functions ---
-def get_pkb_metric(samples, metric_name, default=None):
-    """Finds the first sample matching the metric name and returns its value."""
-    for sample in samples:
-        if sample.get('metric') == metric_name:
-            # Ensure value is serializable (primarily converting float('inf') if it occurs)
-            val = sample.get('value', default)
-            if isinstance(val, float) and (math.isinf(val) or math.isnan(val)):
-                 return None # Represent infinity/NaN as null in JSON
-            return val
-    return default
-
-def get_pkb_label(samples, label_key, default=None):
-    """Extracts a label value from the first sample that has labels."""
-    for sample in samples:
-         if 'labels' in sample and isinstance(sample['labels'], str):
-             parts = sample['labels'].split('|')
-             for part in parts:
-                 if ':' in part:
-                     try:
-                         k, v = part.split(':', 1)
-                         if k == label_key:
-                             if v.startswith("['") and v.endswith("']"):
-                                 v = v[2:-2]
-                             return v
-                     except ValueError:
-                         continue
-    return default
+# Intervals a series must stay within its steady-state band to count as settled
+STEADY_WINDOW = 3
+
+def first_settled_time(timestamps, values, in_band):
+    """First timestamp from which STEADY_WINDOW consecutive known values satisfy in_band."""
+    points = [(t, v) for t, v in zip(timestamps, values) if v is not None]
+    for i in range(len(points)):
+        window = points[i:i + STEADY_WINDOW]
+        if window and all(in_band(v) for _, v in window):
+            return points[i][0]
+    return None
+
+def derive_scaling_metrics(results):
+    """Derives steady-state RPS, time to reach it, and scale-out time from time series.
+
+    Steady state is the mean RPS (and median p50 latency) over the second half of
+    the run. Time to steady state is when RPS first holds >= 90% of that level;
+    scale-out time is when p50 latency first holds <= 120% of its steady level,
+    i.e. when enough instances have started to absorb the load.
+    """
+    timestamps, rps, _, _ = results.time_series('Requests Per Second Time Series')
+    known_rps = [v for v in rps if v is not None]
+    if not known_rps:
+        return None, None, None
+    tail = known_rps[len(known_rps) // 2:]
+    steady_rps = sum(tail) / len(tail)
+    time_to_steady = first_settled_time(timestamps, rps, lambda v: v >= 0.9 * steady_rps)
+
+    scale_out_time = None
+    latency_timestamps, p50, _, _ = results.time_series('Latency p50 Time Series')
+    known_p50 = [v for v in p50 if v is not None]
+    if known_p50:
+        tail = sorted(known_p50[len(known_p50) // 2:])
+        steady_p50 = tail[len(tail) // 2]
+        scale_out_time = first_settled_time(latency_timestamps, p50, lambda v: v <= 1.2 * steady_p50)
+    return round(steady_rps, 2), time_to_steady, scale_out_time
+
+def error_rate_percent(results, **where):
+    """Errors as a percentage of all requests, or None without request counts."""
+    errors = results.metric('Total Errors', default=0.0, **where)
+    completed = results.metric('Completed Requests', default=0.0, **where)
+    if not isinstance(errors, (int, float)) or not isinstance(completed, (int, float)):
+        return None
+    denominator = completed + errors
+    if denominator > 0:
+        return round(errors / denominator * 100, 2)
+    return 100.00 if errors > 0 else 0.00
 
 # --- Initialize Data Holders ---
-pkb_samples = []
+pkb_results = PkbResults()
 infracost_data = None
 summary_data = {
     "run_id": os.getenv('RUN_ID', None),
@@ -62,10 +84,13 @@ summary_data = {
         "latency_p95_ms": None,
         "latency_p99_ms": None,
         "throughput_rps": None,
-        "cold_start_latency": None # Not measured by this setup
+        "cold_start_latency": None, # Time to first response (ms); needs the wrk time series
+        "stages": None # Per load stage breakdown of multi-stage runs
     },
     "scalability_elasticity": {
-        "scale_out_time_sec": None, # Not measured by this setup
+        "steady_state_rps": None,
+        "time_to_steady_state_sec": None,
+        "scale_out_time_sec": None, # Derived from the per-interval latency series
         "resource_utilization": None # Not measured by this setup
     },
     "reliability": {
@@ -74,42 +99,53 @@ summary_data = {
     "cost": {
         "total_estimated_monthly_usd": None,
         "total_estimated_hourly_usd": None,
-        "estimated_cost_per_unit": None, # Still null, calculation complex
-        "resource_cost_breakdown_monthly": None
+        # USD per million requests of the cost model's projected month; null
+        # without a cost model (the monthly total and the run's request count
+        # cover different periods)
+        "estimated_cost_per_unit": None,
+        "cost_unit": "usd_per_million_requests",
+        "resource_cost_breakdown_monthly": None,
+        "cost_model": None # Projection and assumptions from generate_infracost_usage.py
     }
 }
 
 # --- Process PKB Results ---
 try:
-    with open(pkb_file, 'r') as f:
-        for line in f:
-            try:
-                pkb_samples.append(json.loads(line))
-            except json.JSONDecodeError:
-                print(f"Warning: Skipping invalid JSON line in {pkb_file}: {line.strip()}")
-
-    if pkb_samples:
-        # Extract performance metrics
-        summary_data["performance"]["latency_p50_ms"] = get_pkb_metric(pkb_samples, 'Latency p50')
-        summary_data["performance"]["latency_p95_ms"] = get_pkb_metric(pkb_samples, 'Latency p95')
-        summary_data["performance"]["latency_p99_ms"] = get_pkb_metric(pkb_samples, 'Latency p99')
-        summary_data["performance"]["throughput_rps"] = get_pkb_metric(pkb_samples, 'Requests Per Second')
+    pkb_results = PkbResults.load(pkb_file)
+
+    if pkb_results:
+        # Extract performance metrics (whole fleet, first load stage)
+        summary_data["performance"]["latency_p50_ms"] = pkb_results.metric('Latency p50')
+        summary_data["performance"]["latency_p95_ms"] = pkb_results.metric('Latency p95')
+        summary_data["performance"]["latency_p99_ms"] = pkb_results.metric('Latency p99')
+        summary_data["performance"]["throughput_rps"] = pkb_results.metric('Requests Per Second')
+
+        summary_data["performance"]["cold_start_latency"] = pkb_results.metric('First Response Latency')
+
+        stage_names = pkb_results.stages()
+        if len(stage_names) > 1:
+            summary_data["performance"]["stages"] = [
+                {
+                    "stage": stage,
+                    "latency_p50_ms": pkb_results.metric('Latency p50', wrk_stage=stage),
+                    "latency_p99_ms": pkb_results.metric('Latency p99', wrk_stage=stage),
+                    "throughput_rps": pkb_results.metric('Requests Per Second', wrk_stage=stage),
+                    "error_rate_percent": error_rate_percent(pkb_results, wrk_stage=stage),
+                }
+                for stage in stage_names
+            ]
+
+        # Derive scaling behaviour from the per-interval time series
+        steady_rps, time_to_steady, scale_out_time = derive_scaling_metrics(pkb_results)
+        summary_data["scalability_elasticity"]["steady_state_rps"] = steady_rps
+        summary_data["scalability_elasticity"]["time_to_steady_state_sec"] = time_to_steady
+        summary_data["scalability_elasticity"]["scale_out_time_sec"] = scale_out_time
 
         # Extract client VM type
-        summary_data["architecture_configuration"]["pkb_client_vm_type"] = get_pkb_label(pkb_samples, 'machine_type')
+        summary_data["architecture_configuration"]["pkb_client_vm_type"] = pkb_results.label('machine_type')
 
         # Calculate error rate
-        errors = get_pkb_metric(pkb_samples, 'Total Errors', default=0.0)
-        completed = get_pkb_metric(pkb_samples, 'Completed Requests', default=0.0)
-        if isinstance(errors, (int, float)) and isinstance(completed, (int, float)):
-            denominator = completed + errors
-            if denominator > 0:
-                error_rate_val = (errors / denominator) * 100
-                summary_data["reliability"]["error_rate_percent"] = round(error_rate_val, 2)
-            elif errors > 0:
-                 summary_data["reliability"]["error_rate_percent"] = 100.00
-            else:
-                 summary_data["reliability"]["error_rate_percent"] = 0.00
+        summary_data["reliability"]["error_rate_percent"] = error_rate_percent(pkb_results)
     else:
         print(f"Warning: No valid PKB samples found in {pkb_file}. Performance data will be null.")
 
@@ -189,6 +225,23 @@ except Exception as e:
      summary_data["cost"]["total_estimated_hourly_usd"] = None
      summary_data["cost"]["resource_cost_breakdown_monthly"] = None
 
+# --- Process Cost Model ---
+try:
+    with open(cost_model_file, 'r') as f:
+        cost_model = json.load(f)
+    summary_data["cost"]["cost_model"] = {
+        "cost_per_million_requests_usd": cost_model.get('cost_per_million_requests_usd'),
+        "cloud_run_cost_per_million_requests_usd": cost_model.get('cloud_run_cost_per_million_requests_usd'),
+        "projected_monthly": cost_model.get('projected_monthly'),
+        "assumptions": cost_model.get('assumptions'),
+    }
+    if cost_model.get('cost_per_million_requests_usd') is not None:
+        summary_data["cost"]["estimated_cost_per_unit"] = cost_model['cost_per_million_requests_usd']
+except FileNotFoundError:
+    print(f"Warning: Cost model not found at {cost_model_file}. Cost per unit will be null.")
+except json.JSONDecodeError as e:
+    print(f"Error: Could not parse cost model {cost_model_file}: {e}")
+
 # --- Write JSON Report ---
 try:
     with open(output_file, 'w') as f:
@@ -0,0 +1,72 @@
+-- scripts/latency_histogram.lua
+-- Shared by the wrk scripts, which load it with dofile() (from the working
+-- directory or scripts/). latency_bucket() is the bucketing of every latency
+-- table they keep; upload_script.lua and batch_upload_script.lua call
+-- print_latency_histogram(latency, summary.requests) from done().
+--
+-- Prints the latency distribution on one line as "value_us:count" pairs for
+-- PKB. wrk's stats object only offers percentile() for this: indexing it as
+-- latency(i) scans all recorded values for every i, which is quadratic. So the
+-- distribution is read at a fixed grid of percentiles, denser towards the tail,
+-- and each grid value is given the requests between it and the previous one.
+-- Values are rounded down to 3 significant digits (exact below 1 ms).
+--
+-- Under wrk2 (WRK_LATENCY_HISTOGRAM=0, set by the PKB benchmark for open-loop
+-- stages) nothing is printed: the benchmark uses wrk2's corrected histogram.
+
+local histogram_enabled = os.getenv("WRK_LATENCY_HISTOGRAM") ~= "0"
+
+-- Percentiles read from wrk: every 1% to p90, every 0.2% to p99, every 0.02%
+-- to p99.9, then every 0.01% and 0.001%; the maximum closes the grid.
+local grid = {}
+for i = 1, 90 do table.insert(grid, i) end
+for i = 1, 45 do table.insert(grid, 90 + i * 0.2) end
+for i = 1, 45 do table.insert(grid, 99 + i * 0.02) end
+for i = 1, 9 do table.insert(grid, 99.9 + i * 0.01) end
+for i = 1, 9 do table.insert(grid, 99.99 + i * 0.001) end
+
+-- Rounds a latency (us) down to its bucket: 3 significant digits, exact below 1 ms
+latency_bucket = function(value)
+  if value < 1000 then
+    return value
+  end
+  local scale = 10 ^ (math.floor(math.log10(value)) - 2)
+  return math.floor(value / scale) * scale
+end
+
+local function read_grid(latency, total)
+  local buckets = {}
+  local previous = 0
+  local function add(value, cumulative)
+    if cumulative > previous then
+      local key = latency_bucket(value)
+      buckets[key] = (buckets[key] or 0) + cumulative - previous
+      previous = cumulative
+    end
+  end
+  for _, p in ipairs(grid) do
+    add(latency:percentile(p), math.floor(total * p / 100 + 0.5))
+  end
+  add(latency.max, total)
+  return buckets
+end
+
+print_latency_histogram = function(latency, total)
+  if not histogram_enabled or not total or total <= 0 then
+    return
+  end
+  local ok, buckets = pcall(read_grid, latency, total)
+  if not ok then
+    return -- A stats object without percentile(); percentiles alone are reported
+  end
+  local keys = {}
+  for key in pairs(buckets) do
+    table.insert(keys, key)
+  end
+  table.sort(keys)
+  local pairs_out = {}
+  for _, key in ipairs(keys) do
+    table.insert(pairs_out, string.format("%d:%d", key, buckets[key]))
+  end
+  print("PKB_METRIC_Latency_Histogram_us: " .. table.concat(pairs_out, ","))
+end
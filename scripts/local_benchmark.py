@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# scripts/local_benchmark.py
+# Runs the PKB wrk benchmark against an app instance on this machine, without any
+# cloud resources, and writes pkb_results.json and summary_report.json in the
+# same formats as the GitHub workflow.
+#
+#   local_benchmark.py [--out local_out] [--script scripts/upload_script.lua] \
+#       [--path /upload] [--storage-latency-ms 0] [--app-env KEY=VALUE ...] [--wrk_* flags]
+#
+# The app (app/serve.py) runs with the in-memory storage backend unless --app-env
+# sets STORAGE_BACKEND. Load generation, output parsing and server metric scrapes
+# are wrk_benchmark.Run itself, with the client "VM" being a local shell, so any
+# --wrk_* flag of the benchmark (e.g. --wrk_duration=30 --wrk_load_profile=step)
+# is accepted. Needs wrk (and wrk2 for --wrk_rate), curl, and a PKB checkout
+# (--pkb-dir, default $PKB_DIR) for the modules wrk_benchmark imports.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from cold_start_benchmark import free_port, wait_for_response
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(REPO_ROOT, 'app')
+BENCHMARKS_DIR = os.path.join(REPO_ROOT, 'pkb_extensions', 'linux_benchmarks')
+
+# Defaults for a short local run; later --wrk_* arguments override them
+WRK_DEFAULTS = ['--wrk_num_threads=2', '--wrk_num_conns=16', '--wrk_duration=30']
+
+# --- Local Client ---
+class LocalClient:
+    """Stands in for a PKB client VM: commands run in a local shell from the
+    repository root, where the Lua scripts find sample.jpg."""
+
+    name = 'localhost'
+
+    def RemoteCommandWithReturnCode(self, cmd, ignore_failure=False):
+        result = subprocess.run(['bash', '-c', cmd], cwd=REPO_ROOT, text=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode and not ignore_failure:
+            raise RuntimeError(f"Command failed ({result.returncode}): {cmd}\n{result.stderr}")
+        return result.stdout, result.stderr, result.returncode
+
+class LocalSpec:
+    def __init__(self):
+        self.vm_groups = {'default': [LocalClient()]}
+
+# --- Helpers ---
+def load_wrk_benchmark(pkb_dir, wrk_path, wrk2_path):
+    """Imports wrk_benchmark from this repository with PKB on the path, pointing
+    its wrk and wrk2 binaries at the local ones."""
+    sys.path[:0] = [os.path.abspath(pkb_dir), BENCHMARKS_DIR]
+    try:
+        import wrk_benchmark
+    except ImportError as e:
+        sys.exit(f"Error: Could not import wrk_benchmark ({e}); pass --pkb-dir with a PKB checkout "
+                 "whose requirements are installed.")
+    wrk_benchmark.wrk.WRK_PATH = wrk_path
+    wrk_benchmark.wrk2.WRK2_PATH = wrk2_path
+    return wrk_benchmark
+
+def write_pkb_results(samples, path, run_uri, extra_metadata):
+    """Writes samples as PKB's JSON publisher does: one object per line with
+    metadata flattened into sorted '|key:value|' labels."""
+    with open(path, 'w') as f:
+        for s in samples:
+            metadata = dict(s.metadata, **extra_metadata)
+            labels = ','.join(f'|{k}:{v}|' for k, v in sorted(metadata.items()))
+            f.write(json.dumps({'metric': s.metric, 'value': s.value, 'unit': s.unit,
+                                'labels': labels, 'test': 'wrk', 'run_uri': run_uri,
+                                'timestamp': s.timestamp}) + '\n')
+
+# --- CLI ---
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the app locally with the PKB wrk benchmark; other --wrk_* '
+                    'arguments are passed to it.')
+    parser.add_argument('--out', default='local_out', help='Directory for results and the app log')
+    parser.add_argument('--script', default=os.path.join(REPO_ROOT, 'scripts', 'upload_script.lua'),
+                        help='wrk Lua script (default scripts/upload_script.lua)')
+    parser.add_argument('--path', default='/upload', help='Target path on the app')
+    parser.add_argument('--storage-latency-ms', type=float, default=0.0,
+                        help='Simulated storage write latency (STORAGE_LATENCY_MS)')
+    parser.add_argument('--app-env', action='append', default=[],
+                        help='Extra KEY=VALUE environment of the app (repeatable)')
+    parser.add_argument('--pkb-dir', default=os.getenv('PKB_DIR', 'PerfKitBenchmarker'),
+                        help='PKB checkout providing the perfkitbenchmarker modules')
+    parser.add_argument('--wrk-path', default=shutil.which('wrk'), help='wrk binary (default: from PATH)')
+    parser.add_argument('--wrk2-path', default=shutil.which('wrk2'), help='wrk2 binary for --wrk_rate')
+    parser.add_argument('--run-id', default=f"local-{time.strftime('%Y%m%d-%H%M%S')}",
+                        help='run_id of the summary report')
+    args, wrk_args = parser.parse_known_args()
+    if not args.wrk_path:
+        sys.exit("Error: wrk not found; install it or pass --wrk-path.")
+    unknown = [a for a in wrk_args if not a.startswith('--wrk_')]
+    if unknown:
+        parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+
+    os.makedirs(args.out, exist_ok=True)
+    wrk_benchmark = load_wrk_benchmark(args.pkb_dir, args.wrk_path, args.wrk2_path or args.wrk_path)
+
+    app_env = {'STORAGE_BACKEND': 'memory', 'STORAGE_LATENCY_MS': str(args.storage_latency_ms),
+               'ACCESS_LOG': '0'}
+    for item in args.app_env:
+        key, sep, value = item.partition('=')
+        if not sep:
+            parser.error(f"--app-env expects KEY=VALUE, got {item!r}")
+        app_env[key] = value
+    port = free_port()
+    app_log_path = os.path.join(args.out, 'app.log')
+    with open(app_log_path, 'w') as app_log:
+        app = subprocess.Popen([sys.executable, 'serve.py'], cwd=APP_DIR,
+                               env={**os.environ, **app_env, 'PORT': str(port), 'HOST': '127.0.0.1'},
+                               stdout=app_log, stderr=subprocess.STDOUT)
+    try:
+        if wait_for_response(f'http://127.0.0.1:{port}/', app, 60) is None:
+            sys.exit(f"Error: The app did not start; see {app_log_path}")
+        print(f"App ({app_env['STORAGE_BACKEND']} storage) listening on port {port}")
+
+        script = os.path.abspath(args.script)
+        wrk_benchmark.FLAGS(['local_benchmark', *WRK_DEFAULTS,
+                             f'--wrk_target_url=http://127.0.0.1:{port}{args.path}',
+                             f'--wrk_script_local_path={script}', f'--wrk_script_remote_path={script}',
+                             '--wrk_client_start_delay=0', *wrk_args])
+        samples = wrk_benchmark.Run(LocalSpec())
+    finally:
+        app.terminate()
+        app.wait()
+
+    # Stands in for the client VM metadata PKB adds; the summary reports it as pkb_client_vm_type
+    extra_metadata = {'machine_type': f'local-{platform.machine()}-{os.cpu_count()}cpu',
+                      'storage_backend': app_env['STORAGE_BACKEND'],
+                      'storage_latency_ms': app_env['STORAGE_LATENCY_MS']}
+    pkb_results = os.path.join(args.out, 'pkb_results.json')
+    write_pkb_results(samples, pkb_results, args.run_id, extra_metadata)
+    print(f"Wrote {len(samples)} samples to {pkb_results}")
+
+    # Same report as the workflow; there is no deployment, so the cost fields stay null
+    summary = os.path.join(args.out, 'summary_report.json')
+    subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'scripts', 'generate_summary_report.py'),
+                    pkb_results, os.path.join(args.out, 'infracost_estimate_with_usage.json'), summary,
+                    os.path.join(args.out, 'cost_model.json')],
+                   env={**os.environ, 'RUN_ID': args.run_id}, check=True)
+
+if __name__ == '__main__':
+    main()
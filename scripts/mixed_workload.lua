@@ -0,0 +1,293 @@
+-- scripts/mixed_workload.lua
+-- Lua script for wrk that mixes uploads (POST /upload) and downloads
+-- (GET /download/{key}) to mimic production traffic instead of a write loop.
+-- Pass the service root as the wrk URL, e.g. http://__TARGET_IP__/
+--
+-- Tunables (environment variables on the client VM, defaults in brackets):
+--   WRK_WRITE_PERCENT  share of requests that are uploads [20]
+--   WRK_KEY_COUNT      number of distinct object keys [1000]
+--   WRK_KEY_DIST       key popularity: "uniform" or "zipf" [zipf]
+--   WRK_ZIPF_S         Zipf exponent; larger means a hotter head [1.1]
+--   WRK_OBJECT_SIZES   "bytes:weight,..." object size distribution
+--                      [16384:0.5,49152:0.3,262144:0.15,1048576:0.05]
+--   WRK_SEED           seed for key sizes, so all threads agree on them [42]
+--
+-- Every thread first uploads its share of the keys so downloads find them,
+-- then draws operations from the mix. These populate uploads are left out of
+-- all reported numbers. A download that still gets a 404 (its key belongs to a
+-- thread that has not finished populating) is reported as a "miss" operation
+-- instead of a read. done() prints per-operation counts, latency percentiles
+-- and histograms for PKB parsing.
+
+local write_percent = tonumber(os.getenv("WRK_WRITE_PERCENT") or "") or 20
+local key_count = tonumber(os.getenv("WRK_KEY_COUNT") or "") or 1000
+local key_dist = os.getenv("WRK_KEY_DIST") or "zipf"
+local zipf_s = tonumber(os.getenv("WRK_ZIPF_S") or "") or 1.1
+local size_spec = os.getenv("WRK_OBJECT_SIZES") or "16384:0.5,49152:0.3,262144:0.15,1048576:0.05"
+local seed = tonumber(os.getenv("WRK_SEED") or "") or 42
+
+-- Cumulative distribution helpers: build from weights, sample with a uniform draw
+local function build_cdf(weights)
+  local total, cdf = 0, {}
+  for i, weight in ipairs(weights) do
+    total = total + weight
+    cdf[i] = total
+  end
+  for i = 1, #cdf do
+    cdf[i] = cdf[i] / total
+  end
+  return cdf
+end
+
+local function sample_cdf(cdf, u)
+  local low, high = 1, #cdf
+  while low < high do
+    local mid = math.floor((low + high) / 2)
+    if cdf[mid] < u then low = mid + 1 else high = mid end
+  end
+  return low
+end
+
+-- Object sizes and one payload per size, shared by all keys of that size
+local sizes, size_weights = {}, {}
+for size, weight in string.gmatch(size_spec, "(%d+):([%d.]+)") do
+  table.insert(sizes, tonumber(size))
+  table.insert(size_weights, tonumber(weight))
+end
+local size_cdf = build_cdf(size_weights)
+local block = {}
+for i = 1, 1024 do
+  block[i] = string.char((i * 131) % 256)
+end
+block = table.concat(block)
+local payloads = {}
+for i, size in ipairs(sizes) do
+  payloads[i] = string.rep(block, math.ceil(size / #block)):sub(1, size)
+end
+
+-- Each key gets a fixed size; the same seed gives every thread the same mapping
+math.randomseed(seed)
+local key_size = {}
+for key = 1, key_count do
+  key_size[key] = sample_cdf(size_cdf, math.random())
+end
+
+-- Key popularity: rank 1 is the most requested key
+local key_weights = {}
+for rank = 1, key_count do
+  key_weights[rank] = key_dist == "zipf" and 1 / rank ^ zipf_s or 1
+end
+local key_cdf = build_cdf(key_weights)
+
+local function key_name(key)
+  return "obj_" .. key .. ".bin"
+end
+
+local ffi = require("ffi")
+ffi.cdef[[
+  typedef struct { long tv_sec; long tv_usec; } pkb_timeval;
+  int gettimeofday(pkb_timeval *tv, void *tz);
+]]
+local timeval = ffi.new("pkb_timeval")
+local function now_us()
+  ffi.C.gettimeofday(timeval, nil)
+  return tonumber(timeval.tv_sec) * 1000000 + tonumber(timeval.tv_usec)
+end
+
+local function upload(key, op)
+  local boundary = "---------------------------" .. string.format("%x", math.random(0, 0xFFFFFFFF))
+  local body = table.concat({
+    "--" .. boundary .. "\r\n",
+    "Content-Disposition: form-data; name=\"file\"; filename=\"" .. key_name(key) .. "\"\r\n",
+    "Content-Type: application/octet-stream\r\n\r\n",
+    payloads[key_size[key]], "\r\n",
+    "--" .. boundary .. "--\r\n",
+  })
+  return wrk.format("POST", "/upload", {
+    ["Content-Type"] = "multipart/form-data; boundary=" .. boundary,
+    -- Both echoed back by the app, so response() knows which operation
+    -- completed and how long it took
+    ["X-Client-Op"] = op or "write",
+    ["X-Client-Sent"] = string.format("%.0f", now_us()),
+  }, body)
+end
+
+local function download(key)
+  return wrk.format("GET", "/download/" .. key_name(key), {
+    ["X-Client-Op"] = "read",
+    ["X-Client-Sent"] = string.format("%.0f", now_us()),
+  })
+end
+
+-- wrk calls setup() and init() for each thread before creating the next, so
+-- the thread count is read from wrk's own command line instead.
+local function wrk_thread_count()
+  local f = io.open("/proc/self/cmdline", "rb")
+  local cmdline = f and f:read("*a") or ""
+  if f then f:close() end
+  local args = {}
+  for arg in string.gmatch(cmdline, "[^%z]+") do
+    table.insert(args, arg)
+  end
+  for i, arg in ipairs(args) do
+    local value = arg:match("^%-%-threads=(%d+)$") or arg:match("^%-t(%d+)$")
+    if not value and (arg == "--threads" or arg == "-t") then
+      value = args[i + 1]
+    end
+    if tonumber(value) then
+      return tonumber(value)
+    end
+  end
+  return 2 -- wrk's default
+end
+local thread_count = tonumber(os.getenv("WRK_THREADS") or "") or wrk_thread_count()
+
+-- Per-thread state; done() reads it through thread:get()
+local threads = {}
+setup = function(thread)
+  table.insert(threads, thread)
+  thread:set("thread_index", #threads - 1)
+end
+
+local populate_next
+init = function(args)
+  math.randomseed(seed + (thread_index or 0) + os.time())
+  populate_next = (thread_index or 0) + 1
+end
+
+request = function()
+  -- Populate phase: this thread uploads keys thread_index+1, +thread_count, ...
+  if populate_next <= key_count then
+    local key = populate_next
+    populate_next = populate_next + thread_count
+    return upload(key, "populate")
+  end
+  local key = sample_cdf(key_cdf, math.random())
+  if math.random() * 100 < write_percent then
+    return upload(key)
+  end
+  return download(key)
+end
+
+-- latency_bucket() and print_latency_histogram(), shared with the other scripts
+for _, path in ipairs({"latency_histogram.lua", "scripts/latency_histogram.lua"}) do
+  local f = io.open(path, "r")
+  if f then
+    f:close()
+    dofile(path)
+    break
+  end
+end
+if not latency_bucket then
+  error("latency_histogram.lua not found in the working directory or scripts/")
+end
+
+op_counts = {}
+op_errors = {}
+op_latency = {}  -- op -> {latency bucket (us) -> count}
+
+response = function(status, headers, body)
+  local now = now_us()
+  local op = headers["x-client-op"] or headers["X-Client-Op"] or "unknown"
+  if op == "read" and status == 404 then
+    op = "miss"
+  end
+  op_counts[op] = (op_counts[op] or 0) + 1
+  if status > 399 then
+    op_errors[op] = (op_errors[op] or 0) + 1
+  end
+  local sent = tonumber(headers["x-client-sent"] or headers["X-Client-Sent"] or "")
+  if sent then
+    local buckets = op_latency[op] or {}
+    local key = latency_bucket(now - sent)
+    buckets[key] = (buckets[key] or 0) + 1
+    op_latency[op] = buckets
+  end
+end
+
+local function bucket_percentile(keys, buckets, total, percentile)
+  local seen = 0
+  for _, key in ipairs(keys) do
+    seen = seen + buckets[key]
+    if seen >= total * percentile / 100.0 then
+      return key / 1000.0
+    end
+  end
+  return keys[#keys] / 1000.0
+end
+
+done = function(summary, latency, requests)
+  local counts, errors, merged = {}, {}, {}
+  for _, thread in ipairs(threads) do
+    for op, count in pairs(thread:get("op_counts") or {}) do
+      counts[op] = (counts[op] or 0) + count
+    end
+    for op, count in pairs(thread:get("op_errors") or {}) do
+      errors[op] = (errors[op] or 0) + count
+    end
+    for op, buckets in pairs(thread:get("op_latency") or {}) do
+      local target = merged[op] or {}
+      for key, count in pairs(buckets) do
+        target[key] = (target[key] or 0) + count
+      end
+      merged[op] = target
+    end
+  end
+
+  -- Populate uploads are not part of the mix: the benchmark subtracts them from
+  -- wrk's request and error totals, and the overall percentiles below come from
+  -- the mix operations only.
+  print(string.format("PKB_METRIC_Excluded_Requests: %d", counts["populate"] or 0))
+  print(string.format("PKB_METRIC_Excluded_Errors: %d", errors["populate"] or 0))
+  counts["populate"], errors["populate"], merged["populate"] = nil, nil, nil
+
+  local overall, overall_keys, overall_total = {}, {}, 0
+  for _, buckets in pairs(merged) do
+    for key, n in pairs(buckets) do
+      if not overall[key] then
+        table.insert(overall_keys, key)
+      end
+      overall[key] = (overall[key] or 0) + n
+      overall_total = overall_total + n
+    end
+  end
+  table.sort(overall_keys)
+  -- Overall numbers in the same format as upload_script.lua; wrk's own latency
+  -- stats (which include populate) only when the app does not echo X-Client-Sent
+  for _, p in ipairs({{"p50", 50.0}, {"p90", 90.0}, {"p95", 95.0}, {"p99", 99.0}, {"p999", 99.9}}) do
+    local value_ms
+    if overall_total > 0 then
+      value_ms = bucket_percentile(overall_keys, overall, overall_total, p[2])
+    else
+      value_ms = latency:percentile(p[2]) / 1000.0
+    end
+    print(string.format("PKB_METRIC_Latency_%s: %.3f ms", p[1], value_ms))
+  end
+
+  -- One line per operation:
+  -- "op,requests,errors,requests_per_sec,p50_ms,p90_ms,p95_ms,p99_ms,p999_ms,mean_ms"
+  local duration_sec = summary.duration / 1000000.0
+  for op, count in pairs(counts) do
+    local buckets = merged[op] or {}
+    local keys, total, sum = {}, 0, 0
+    for key, n in pairs(buckets) do
+      table.insert(keys, key)
+      total = total + n
+      sum = sum + key * n
+    end
+    table.sort(keys)
+    local line = string.format("PKB_METRIC_Op: %s,%d,%d,%.2f", op, count, errors[op] or 0, count / duration_sec)
+    if total > 0 then
+      for _, percentile in ipairs({50, 90, 95, 99, 99.9}) do
+        line = line .. string.format(",%.3f", bucket_percentile(keys, buckets, total, percentile))
+      end
+      line = line .. string.format(",%.3f", sum / total / 1000.0)
+      local pairs_out = {}
+      for _, key in ipairs(keys) do
+        table.insert(pairs_out, string.format("%d:%d", key, buckets[key]))
+      end
+      print(string.format("PKB_METRIC_Op_Histogram_us: %s %s", op, table.concat(pairs_out, ",")))
+    end
+    print(line)
+  end
+end
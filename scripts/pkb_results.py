@@ -0,0 +1,154 @@
+# scripts/pkb_results.py
+# Single-pass, indexed reader of PKB JSON-lines results, shared by the report scripts.
+#
+#   from pkb_results import PkbResults
+#   results = PkbResults.load('pkb_results.json')
+#   results.metric('Latency p99')                        # whole fleet, first stage
+#   results.metric('Latency p99', wrk_stage='peak')      # one stage
+#   results.grouped('Requests Per Second', 'wrk_stage')  # {stage: [sample, ...]}
+#
+# Samples of multi-client runs carry a wrk_client label (the client VM, or 'all'
+# for the combined fleet). Lookups without a wrk_client filter skip per-client
+# samples, so a metric means the whole fleet whether or not the run had several
+# clients.
+
+import json
+import math
+from collections import defaultdict
+
+
+def parse_labels(labels):
+    """Parses a PKB labels string ('|key:value|,|key:value|') into a dict."""
+    parsed = {}
+    for part in labels.split('|'):
+        if ':' in part:
+            k, v = part.split(':', 1)
+            if v.startswith("['") and v.endswith("']"):
+                v = v[2:-2]
+            parsed[k] = v
+    return parsed
+
+
+class Sample:
+    """One PKB sample with its labels parsed once."""
+    __slots__ = ('metric', 'value', 'unit', 'labels', 'raw_labels')
+
+    def __init__(self, record):
+        self.metric = record.get('metric')
+        self.value = record.get('value')
+        self.unit = record.get('unit')
+        self.raw_labels = record.get('labels') if isinstance(record.get('labels'), str) else ''
+        self.labels = parse_labels(self.raw_labels)
+
+    @property
+    def number(self):
+        """The value if it is a finite number, else None (JSON has no NaN/Infinity)."""
+        if isinstance(self.value, bool) or not isinstance(self.value, (int, float)):
+            return None
+        return None if math.isnan(self.value) or math.isinf(self.value) else self.value
+
+    @property
+    def fleet(self):
+        """True unless this is one client's share of a multi-client run."""
+        return self.labels.get('wrk_client', 'all') == 'all'
+
+    def matches(self, where):
+        return all(self.labels.get(k) == str(v) for k, v in where.items())
+
+
+class PkbResults:
+    """PKB samples indexed by metric, in file order.
+
+    `where` keyword arguments of the lookups filter on labels (compared as
+    strings, e.g. wrk_stage_index=1); without wrk_client only whole-fleet
+    samples match.
+    """
+
+    def __init__(self, samples=()):
+        self.samples = []
+        self.by_metric = defaultdict(list)
+        self.label_values = {}  # label -> value in the first sample that has it
+        for sample in samples:
+            self.add(sample)
+
+    @classmethod
+    def load(cls, path):
+        """Streams a JSON-lines file; invalid lines are reported and skipped.
+        Raises FileNotFoundError like open()."""
+        results = cls()
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Warning: Skipping invalid JSON line in {path}: {line.strip()}")
+                    continue
+                results.add(Sample(record))
+        return results
+
+    def add(self, sample):
+        self.samples.append(sample)
+        self.by_metric[sample.metric].append(sample)
+        for k, v in sample.labels.items():
+            self.label_values.setdefault(k, v)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _iter(self, metric, where):
+        fleet_only = 'wrk_client' not in where
+        return (s for s in self.by_metric.get(metric, ())
+                if (s.fleet or not fleet_only) and s.matches(where))
+
+    def find(self, metric, **where):
+        """All samples of `metric` matching `where`, in file order."""
+        return list(self._iter(metric, where))
+
+    def first(self, metric, **where):
+        return next(self._iter(metric, where), None)
+
+    def metric(self, metric, default=None, **where):
+        """Value of the first matching sample (the first stage), or `default` when
+        there is none or its value is not a finite number."""
+        sample = self.first(metric, **where)
+        value = None if sample is None else sample.number
+        return default if value is None else value
+
+    def label(self, key, default=None):
+        """Value of label `key` in the first sample that has it."""
+        return self.label_values.get(key, default)
+
+    def grouped(self, metric, *keys, **where):
+        """Matching samples of `metric` grouped by the values of label `keys`,
+        e.g. grouped('Latency p99', 'wrk_stage') -> {'warmup': [...], ...}; with
+        several keys the groups are keyed by tuples. Groups keep the order in
+        which they first appear."""
+        groups = {}
+        for sample in self.find(metric, **where):
+            key = tuple(sample.labels.get(k) for k in keys)
+            groups.setdefault(key[0] if len(keys) == 1 else key, []).append(sample)
+        return groups
+
+    def stages(self):
+        """Load stage names in run order."""
+        stages = {}
+        for sample in self.samples:
+            if 'wrk_stage' in sample.labels:
+                stages.setdefault(sample.labels['wrk_stage'], None)
+        return list(stages)
+
+    def time_series(self, metric, **where):
+        """(timestamps, values, interval_sec, labels) of the first matching
+        time-series sample. The wrk benchmark stores series as JSON lists in the
+        'timestamps' and 'values' labels; values are None for intervals without
+        data."""
+        sample = self.first(metric, **where)
+        if sample is None:
+            return [], [], 1.0, {}
+        try:
+            return (json.loads(sample.labels['timestamps']), json.loads(sample.labels['values']),
+                    float(sample.labels.get('interval', 1)), sample.labels)
+        except (KeyError, ValueError):
+            return [], [], 1.0, sample.labels
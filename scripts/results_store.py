@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# scripts/results_store.py
+# Local SQLite store of benchmark runs and regression check against past runs.
+#
+#   results_store.py ingest summary_report.json pkb_results.json [--run-id ID]
+#   results_store.py list [--config KEY]
+#   results_store.py compare RUN_ID [--baseline RUN_ID ...] [--alpha 0.05]
+#
+# Runs are keyed by run ID and by a configuration key built from the Cloud Run
+# settings and client VM type, so by default a run is compared with the latest
+# runs of the same configuration. 'compare' exits with status 1 on a regression.
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from pkb_results import PkbResults, parse_labels
+
+DEFAULT_DB = os.getenv('RESULTS_DB', os.path.join(os.getcwd(), 'results.db'))
+
+# Configuration fields of summary_report.json that identify comparable runs
+CONFIG_FIELDS = ['cloud_run_memory_mb', 'cloud_run_cpu_cores', 'cloud_run_concurrency_limit',
+                 'cloud_run_min_instances', 'cloud_run_max_instances', 'pkb_client_vm_type']
+
+# Metrics checked by 'compare': (name, per-interval series, summary path, higher is better)
+CHECKED_METRICS = [
+    ('throughput_rps', 'Requests Per Second Time Series', ('performance', 'throughput_rps'), True),
+    ('latency_p99_ms', 'Latency p99 Time Series', ('performance', 'latency_p99_ms'), False),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    config_key TEXT NOT NULL,
+    config_json TEXT NOT NULL,
+    ingested_at REAL NOT NULL,
+    summary_json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_config ON runs (config_key, ingested_at);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    value REAL,
+    unit TEXT,
+    wrk_stage TEXT,
+    wrk_client TEXT,
+    labels TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_by_run ON samples (run_id, metric);
+"""
+
+# --- Helpers ---
+def config_of(summary):
+    config = summary.get('architecture_configuration') or {}
+    return {field: config.get(field) for field in CONFIG_FIELDS}
+
+def config_key(config):
+    """Short stable hash of the configuration, e.g. '3f2a9c1b'."""
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:8]
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA foreign_keys = ON')
+    db.executescript(SCHEMA)
+    return db
+
+# --- Statistics ---
+def mann_whitney_p(a, b, alternative):
+    """One-sided Mann-Whitney U p-value that values in `a` are `alternative` ('less'
+    or 'greater') than in `b`, normal approximation with tie correction."""
+    n1, n2 = len(a), len(b)
+    ranked = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(ranked)
+    tie_term = 0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        tie_term += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u1 = sum(r for r, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u1 - n1 * n2 / 2.0) / math.sqrt(variance)
+    if alternative == 'greater':
+        z = -z
+    # P(Z <= z) for 'less'
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+def two_proportion_p(errors_a, total_a, errors_b, total_b):
+    """One-sided z-test p-value that the error proportion of a exceeds that of b."""
+    if total_a <= 0 or total_b <= 0:
+        return 1.0
+    pooled = (errors_a + errors_b) / (total_a + total_b)
+    variance = pooled * (1 - pooled) * (1.0 / total_a + 1.0 / total_b)
+    if variance <= 0:
+        return 1.0
+    z = (errors_a / total_a - errors_b / total_b) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+# --- Store access ---
+def ingest(db, summary_file, pkb_file, run_id=None):
+    with open(summary_file) as f:
+        summary = json.load(f)
+    run_id = run_id or summary.get('run_id')
+    if not run_id:
+        sys.exit(f"Error: {summary_file} has no run_id; pass --run-id.")
+    config = config_of(summary)
+    samples = PkbResults.load(pkb_file).samples if pkb_file else []
+    with db:
+        # Re-ingesting a run replaces it
+        db.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+        db.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?)',
+                   (run_id, config_key(config), json.dumps(config, sort_keys=True),
+                    time.time(), json.dumps(summary)))
+        rows = []
+        for s in samples:
+            rows.append((run_id, s.metric, s.number, s.unit,
+                         s.labels.get('wrk_stage'), s.labels.get('wrk_client'), s.raw_labels))
+        db.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    print(f"Ingested run {run_id} (config {config_key(config)}, {len(samples)} PKB samples)")
+
+def run_summary(db, run_id):
+    row = db.execute('SELECT summary_json, config_key FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+    if row is None:
+        sys.exit(f"Error: Run {run_id} is not in the store.")
+    return json.loads(row[0]), row[1]
+
+def first_sample(db, run_id, metric):
+    """(value, labels) of the run's first sample of `metric` from the whole client fleet.
+
+    Like generate_summary_report.py this is the first matching sample, i.e. the
+    first load stage; per-client samples of multi-client runs are skipped.
+    """
+    for value, client, labels in db.execute(
+            'SELECT value, wrk_client, labels FROM samples WHERE run_id = ? AND metric = ? '
+            'ORDER BY rowid', (run_id, metric)):
+        if client in (None, 'all'):
+            return value, parse_labels(labels or '')
+    return None, {}
+
+def steady_series(db, run_id, metric):
+    """Known values of the second half of a time series (the steady state, as in
+    generate_summary_report.py), the per-interval observations a test can use."""
+    _, labels = first_sample(db, run_id, metric)
+    try:
+        values = [v for v in json.loads(labels['values']) if v is not None]
+    except (KeyError, ValueError):
+        return []
+    return values[len(values) // 2:]
+
+def baseline_runs(db, run_id, key, count):
+    rows = db.execute('SELECT run_id FROM runs WHERE config_key = ? AND run_id != ? '
+                      'ORDER BY ingested_at DESC LIMIT ?', (key, run_id, count))
+    return [r[0] for r in rows]
+
+def get_path(summary, path):
+    for key in path:
+        summary = (summary or {}).get(key)
+    return summary
+
+def compare(db, run_id, baselines, alpha, min_change_pct, min_error_rate_pp):
+    """Returns per-metric verdicts of `run_id` against the pooled baseline runs.
+
+    A metric regresses when it moves in the bad direction by more than
+    min_change_pct (min_error_rate_pp percentage points for the error rate) and
+    the change is significant at `alpha`: a Mann-Whitney U
+    test over steady-state intervals for throughput and p99, a two-proportion
+    z-test over request counts for the error rate.
+    """
+    summary, _ = run_summary(db, run_id)
+    base_summaries = [run_summary(db, b)[0] for b in baselines]
+    results = []
+    for name, series_metric, path, higher_is_better in CHECKED_METRICS:
+        candidate = get_path(summary, path)
+        base_values = [v for v in (get_path(s, path) for s in base_summaries) if v is not None]
+        if candidate is None or not base_values:
+            results.append({'metric': name, 'verdict': 'no data'})
+            continue
+        baseline = sum(base_values) / len(base_values)
+        change_pct = (candidate - baseline) / baseline * 100 if baseline else 0.0
+        worse = change_pct < -min_change_pct if higher_is_better else change_pct > min_change_pct
+        candidate_series = steady_series(db, run_id, series_metric)
+        base_series = [v for b in baselines for v in steady_series(db, b, series_metric)]
+        p_value = None
+        if len(candidate_series) >= 3 and len(base_series) >= 3:
+            p_value = mann_whitney_p(candidate_series, base_series,
+                                     'less' if higher_is_better else 'greater')
+        results.append({'metric': name, 'baseline': baseline, 'candidate': candidate,
+                        'change_pct': round(change_pct, 2), 'p_value': p_value,
+                        'verdict': verdict(worse, p_value, alpha)})
+
+    # Error rate from request counts of the first stage
+    counts = {}
+    for rid in [run_id] + baselines:
+        errors, _ = first_sample(db, rid, 'Total Errors')
+        completed, _ = first_sample(db, rid, 'Completed Requests')
+        if errors is not None and completed is not None:
+            counts[rid] = (errors, errors + completed)
+    base_counts = [counts[b] for b in baselines if b in counts]
+    if run_id in counts and base_counts:
+        errors, total = counts[run_id]
+        base_errors = sum(c[0] for c in base_counts)
+        base_total = sum(c[1] for c in base_counts)
+        candidate = errors / total * 100 if total else 0.0
+        baseline = base_errors / base_total * 100 if base_total else 0.0
+        p_value = two_proportion_p(errors, total, base_errors, base_total)
+        # Percentage points, since a baseline error rate is often zero
+        worse = candidate - baseline > min_error_rate_pp
+        results.append({'metric': 'error_rate_percent', 'baseline': baseline, 'candidate': candidate,
+                        'change_pct': round(candidate - baseline, 4), 'p_value': p_value,
+                        'verdict': verdict(worse, p_value, alpha)})
+    else:
+        results.append({'metric': 'error_rate_percent', 'verdict': 'no data'})
+    return results
+
+def verdict(worse, p_value, alpha):
+    if not worse:
+        return 'ok'
+    if p_value is None:
+        return 'changed (not testable)'
+    return 'REGRESSION' if p_value < alpha else 'ok (not significant)'
+
+# --- CLI ---
+def main():
+    parser = argparse.ArgumentParser(
+        description='Store benchmark runs in SQLite and flag regressions against a baseline.')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite file (default $RESULTS_DB or ./results.db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = commands.add_parser('ingest', help='Add a run (summary report and PKB samples)')
+    ingest_parser.add_argument('summary', help='summary_report.json')
+    ingest_parser.add_argument('pkb_results', nargs='?', help='pkb_results.json (newline-delimited)')
+    ingest_parser.add_argument('--run-id', help='Overrides the run_id of the summary report')
+
+    list_parser = commands.add_parser('list', help='List stored runs')
+    list_parser.add_argument('--config', help='Only runs with this configuration key')
+
+    compare_parser = commands.add_parser('compare', help='Compare a run with baseline runs')
+    compare_parser.add_argument('run_id')
+    compare_parser.add_argument('--baseline', action='append', default=[],
+                                help='Baseline run ID (repeatable); default: latest runs of the same configuration')
+    compare_parser.add_argument('--baseline-count', type=int, default=5,
+                                help='Number of latest same-configuration runs used as baseline')
+    compare_parser.add_argument('--alpha', type=float, default=0.05, help='Significance level')
+    compare_parser.add_argument('--min-change-pct', type=float, default=5.0,
+                                help='Smallest throughput/p99 change worth flagging, in percent')
+    compare_parser.add_argument('--min-error-rate-pp', type=float, default=0.1,
+                                help='Smallest error rate increase worth flagging, in percentage points')
+    compare_parser.add_argument('--json', dest='json_out', help='Also write the verdicts to this file')
+
+    args = parser.parse_args()
+    db = connect(args.db)
+    if args.command == 'ingest':
+        ingest(db, args.summary, args.pkb_results, args.run_id)
+    elif args.command == 'list':
+        query = 'SELECT run_id, config_key, config_json, ingested_at FROM runs'
+        params = ()
+        if args.config:
+            query += ' WHERE config_key = ?'
+            params = (args.config,)
+        for run_id, key, config, ingested_at in db.execute(query + ' ORDER BY ingested_at', params):
+            stamp = time.strftime('%Y-%m-%d %H:%M', time.localtime(ingested_at))
+            print(f"{stamp}  {key}  {run_id}  {config}")
+    else:
+        _, key = run_summary(db, args.run_id)
+        baselines = args.baseline or baseline_runs(db, args.run_id, key, args.baseline_count)
+        if not baselines:
+            sys.exit(f"Error: No baseline runs with configuration {key}; pass --baseline.")
+        results = compare(db, args.run_id, baselines, args.alpha, args.min_change_pct,
+                          args.min_error_rate_pp)
+        print(f"Run {args.run_id} vs. {len(baselines)} baseline run(s): {', '.join(baselines)}")
+        print(f"{'metric':<20} {'baseline':>12} {'candidate':>12} {'change':>9} {'p-value':>9}  verdict")
+        for r in results:
+            if 'baseline' not in r:
+                print(f"{r['metric']:<20} {'':>12} {'':>12} {'':>9} {'':>9}  {r['verdict']}")
+                continue
+            p_value = f"{r['p_value']:.4f}" if r['p_value'] is not None else 'n/a'
+            print(f"{r['metric']:<20} {r['baseline']:>12.3f} {r['candidate']:>12.3f} "
+                  f"{r['change_pct']:>+9.2f} {p_value:>9}  {r['verdict']}")
+        if args.json_out:
+            with open(args.json_out, 'w') as f:
+                json.dump({'run_id': args.run_id, 'baselines': baselines, 'results': results}, f, indent=2)
+        if any(r['verdict'] == 'REGRESSION' for r in results):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
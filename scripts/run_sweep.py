@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# scripts/run_sweep.py
+# Runs deploy -> benchmark -> cost for many Cloud Run configurations and builds the
+# Pareto frontier of cost per million requests vs. p99 latency.
+#
+#   run_sweep.py run sweep_grid.yaml --out sweep_out [--strategy grid|greedy]
+#   run_sweep.py pareto sweep_out/*/summary_report.json [--out pareto.json]
+#
+# All points share one Terraform run_id, so the bucket, load balancer and service
+# account are created once and each point only updates the Cloud Run service in
+# place. PKB client VMs are likewise provisioned once (--run_stage) and reused.
+# Needs terraform, infracost and a PKB checkout with the wrk module installed, as
+# in the GitHub workflow; the wrk scripts and sample.jpg are copied into it. The
+# --run-id and --p99-slo-ms options override run_id and p99_slo_ms of the grid file.
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import yaml # Requires PyYAML
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INFRA_DIR = os.path.join(REPO_ROOT, 'infra')
+PKB_TEMPLATE = os.path.join(REPO_ROOT, 'pkb', 'configs', 'cloudrun_image_saver_wrk.yaml.template')
+SAMPLE_FILE = os.path.join(REPO_ROOT, 'sample.jpg')
+
+# Used when neither the command line nor the sweep file sets them
+DEFAULT_RUN_ID = 'sweep'
+DEFAULT_P99_SLO_MS = 1000.0
+
+# Cloud Run settings a sweep may vary, in Terraform variable names
+PARAMETERS = ['memory_mb', 'cpu_cores', 'concurrency_limit', 'min_instances', 'max_instances']
+
+# --- Helpers ---
+def point_id(point):
+    """Stable directory name for a point, e.g. 'mem512-cpu1-con80-min0-max10'."""
+    short = {'memory_mb': 'mem', 'cpu_cores': 'cpu', 'concurrency_limit': 'con',
+             'min_instances': 'min', 'max_instances': 'max'}
+    return '-'.join(f"{short[p]}{point[p]}" for p in PARAMETERS)
+
+def run(cmd, env=None, cwd=None, capture=False):
+    """Runs a command, echoing it, and fails the sweep if it fails."""
+    print(f"+ {' '.join(cmd)}", flush=True)
+    result = subprocess.run(cmd, env=env, cwd=cwd, check=True, text=True,
+                            stdout=subprocess.PIPE if capture else None)
+    return result.stdout.strip() if capture else None
+
+def load_grid(path):
+    """Reads the sweep file: 'grid' maps each parameter to its candidate values."""
+    with open(path) as f:
+        spec = yaml.safe_load(f) or {}
+    grid = spec.get('grid', {})
+    unknown = set(grid) - set(PARAMETERS)
+    if unknown:
+        sys.exit(f"Error: Unknown sweep parameters {sorted(unknown)}; expected {PARAMETERS}")
+    defaults = {'memory_mb': [512], 'cpu_cores': [1], 'concurrency_limit': [80],
+                'min_instances': [0], 'max_instances': [10]}
+    grid = {p: list(grid.get(p) or defaults[p]) for p in PARAMETERS}
+    return grid, spec
+
+def summary_point(summary):
+    """(cost per million requests, p99 ms) of a summary report, or None if incomplete."""
+    cost = summary.get('cost', {}).get('estimated_cost_per_unit')
+    p99 = summary.get('performance', {}).get('latency_p99_ms')
+    if cost is None or p99 is None:
+        return None
+    return float(cost), float(p99)
+
+def pareto_frontier(entries):
+    """Entries not dominated on (cost, p99), both minimized, sorted by cost."""
+    frontier = []
+    for entry in entries:
+        cost, p99 = entry['cost_per_million_requests'], entry['latency_p99_ms']
+        dominated = any(
+            o['cost_per_million_requests'] <= cost and o['latency_p99_ms'] <= p99
+            and (o['cost_per_million_requests'] < cost or o['latency_p99_ms'] < p99)
+            for o in entries)
+        if not dominated:
+            frontier.append(entry)
+    return sorted(frontier, key=lambda e: (e['cost_per_million_requests'], e['latency_p99_ms']))
+
+def collect_entries(summary_files):
+    """Reads summary reports into sweep entries; skips files without cost or p99."""
+    entries = []
+    for path in summary_files:
+        try:
+            with open(path) as f:
+                summary = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Skipping {path}: {e}")
+            continue
+        values = summary_point(summary)
+        if values is None:
+            print(f"Warning: Skipping {path}: no cost per unit or p99 latency")
+            continue
+        entries.append({
+            'summary_file': path,
+            'run_id': summary.get('run_id'),
+            'architecture_configuration': summary.get('architecture_configuration'),
+            'cost_per_million_requests': values[0],
+            'latency_p99_ms': values[1],
+            'throughput_rps': summary.get('performance', {}).get('throughput_rps'),
+            'error_rate_percent': summary.get('reliability', {}).get('error_rate_percent'),
+        })
+    return entries
+
+def write_pareto(summary_files, output_file):
+    """Builds the frontier from summary reports, writes it and prints a table."""
+    entries = collect_entries(summary_files)
+    frontier = pareto_frontier(entries)
+    with open(output_file, 'w') as f:
+        json.dump({'points': entries, 'pareto_frontier': frontier}, f, indent=2)
+    print(f"{len(frontier)} of {len(entries)} points on the Pareto frontier:")
+    print(f"{'USD/M req':>10} {'p99 ms':>10} {'RPS':>10}  config")
+    for e in frontier:
+        cfg = e['architecture_configuration'] or {}
+        label = ', '.join(f"{k.replace('cloud_run_', '')}={v}" for k, v in cfg.items()
+                          if k.startswith('cloud_run_') and k != 'cloud_run_image_tag')
+        print(f"{e['cost_per_million_requests']:>10.4f} {e['latency_p99_ms']:>10.2f} "
+              f"{e['throughput_rps'] or 0:>10.1f}  {label}")
+    print(f"Successfully wrote Pareto frontier: {output_file}")
+
+# --- Sweep execution ---
+class Sweep:
+    """Deploys, benchmarks and prices sweep points on shared infrastructure."""
+
+    def __init__(self, args, spec):
+        self.args = args
+        self.out_dir = os.path.abspath(args.out)
+        self.sweep_id = args.run_id or spec.get('run_id') or DEFAULT_RUN_ID
+        self.pkb_dir = os.path.abspath(args.pkb_dir)
+        self.pkb_run_uri = ''.join(c for c in self.sweep_id if c.isalnum())[-10:]
+        self.pkb_config = os.path.join(self.out_dir, 'pkb_config.yaml')
+        self.results = {}  # point_id -> summary report
+        self.deployed = None  # Last point applied with Terraform
+        self.provisioned = False
+        for var in ('TF_VAR_project_id', 'TF_VAR_image_uri'):
+            if not os.getenv(var):
+                sys.exit(f"Error: {var} must be set, as in the GitHub workflow.")
+
+    def env(self, point):
+        env = dict(os.environ, RUN_ID=self.sweep_id)
+        env.setdefault('TF_VAR_region', 'us-central1')
+        env.setdefault('IMAGE_URI', env['TF_VAR_image_uri'])
+        for name in PARAMETERS:
+            env[f'TF_VAR_{name}'] = str(point[name])
+        return env
+
+    def deploy(self, point):
+        """Applies Terraform for the point; after the first point only Cloud Run changes."""
+        env = self.env(point)
+        if self.deployed is None:
+            run(['terraform', 'init', '-input=false'], env=env, cwd=INFRA_DIR)
+        run(['terraform', 'apply', '-auto-approve', '-input=false',
+             f'-var=run_id={self.sweep_id}'], env=env, cwd=INFRA_DIR)
+        self.deployed = point
+        return run(['terraform', 'output', '-raw', 'load_balancer_ip'], env=env,
+                   cwd=INFRA_DIR, capture=True)
+
+    def pkb(self, stage, extra=()):
+        run([sys.executable, 'pkb.py', '--cloud=GCP', f"--project={os.environ['TF_VAR_project_id']}",
+             '--benchmarks=wrk', f'--benchmark_config_file={self.pkb_config}',
+             f'--run_uri={self.pkb_run_uri}', '--accept_licenses=true',
+             f'--run_stage={stage}', *extra], cwd=self.pkb_dir)
+
+    def stage_files(self):
+        """Copies the wrk scripts and sample.jpg to where the PKB config expects
+        them, relative to the PKB root, as the workflow does."""
+        if not os.path.exists(SAMPLE_FILE):
+            sys.exit(f"Error: {SAMPLE_FILE} not found; the wrk scripts upload it.")
+        scripts_dir = os.path.join(self.pkb_dir, 'scripts')
+        os.makedirs(scripts_dir, exist_ok=True)
+        for script in glob.glob(os.path.join(REPO_ROOT, 'scripts', '*.lua')):
+            shutil.copy(script, scripts_dir)
+        shutil.copy(SAMPLE_FILE, self.pkb_dir)
+
+    def benchmark(self, lb_ip, point_dir):
+        """Runs the wrk benchmark; client VMs are provisioned on first use only."""
+        if not self.provisioned:
+            self.stage_files()
+            with open(PKB_TEMPLATE) as f:
+                config = f.read().replace('__TARGET_IP__', lb_ip)
+            with open(self.pkb_config, 'w') as f:
+                f.write(config)
+            self.pkb('provision,prepare')
+            self.provisioned = True
+        results = os.path.join(point_dir, 'pkb_results.json')
+        self.pkb('run', [f'--json_path={results}'])
+        return results
+
+    def price(self, point, pkb_results, point_dir):
+        """Usage file, Infracost with usage and the summary report, as in the workflow."""
+        env = self.env(point)
+        tfvars = os.path.join(point_dir, 'infracost.tfvars.json')
+        with open(tfvars, 'w') as f:
+            json.dump({'project_id': env['TF_VAR_project_id'], 'region': env['TF_VAR_region'],
+                       'image_uri': env['TF_VAR_image_uri'], 'run_id': self.sweep_id,
+                       **point}, f, indent=2)
+        usage = os.path.join(point_dir, 'infracost_usage.yml')
+        sample_size = os.path.getsize(SAMPLE_FILE) if os.path.exists(SAMPLE_FILE) else 0
+        cost_model = os.path.join(point_dir, 'cost_model.json')
+        run([sys.executable, os.path.join(REPO_ROOT, 'scripts', 'generate_infracost_usage.py'),
+             pkb_results, usage, str(sample_size), self.args.traffic_profile, cost_model], env=env)
+        estimate = os.path.join(point_dir, 'infracost_estimate_with_usage.json')
+        run(['infracost', 'breakdown', '--path', '.', '--usage-file', usage, '--format', 'json',
+             '--show-skipped', f'--terraform-var-file={tfvars}', '--out-file', estimate],
+            env=env, cwd=INFRA_DIR)
+        summary_file = os.path.join(point_dir, 'summary_report.json')
+        run([sys.executable, os.path.join(REPO_ROOT, 'scripts', 'generate_summary_report.py'),
+             pkb_results, estimate, summary_file, cost_model], env=env)
+        return summary_file
+
+    def evaluate(self, point):
+        """Returns the point's summary report, running it unless already done."""
+        pid = point_id(point)
+        if pid in self.results:
+            return self.results[pid]
+        point_dir = os.path.join(self.out_dir, pid)
+        summary_file = os.path.join(point_dir, 'summary_report.json')
+        if self.args.resume and os.path.exists(summary_file):
+            print(f"=== {pid}: reusing {summary_file}")
+        else:
+            print(f"=== {pid}: deploy -> benchmark -> cost")
+            os.makedirs(point_dir, exist_ok=True)
+            lb_ip = self.deploy(point)
+            pkb_results = self.benchmark(lb_ip, point_dir)
+            self.price(point, pkb_results, point_dir)
+        with open(summary_file) as f:
+            self.results[pid] = json.load(f)
+        return self.results[pid]
+
+    def teardown(self):
+        if self.provisioned:
+            self.pkb('cleanup,teardown')
+        if self.deployed is not None and not self.args.keep:
+            run(['terraform', 'destroy', '-auto-approve', '-input=false',
+                 f'-var=run_id={self.sweep_id}'], env=self.env(self.deployed), cwd=INFRA_DIR)
+
+def grid_points(grid):
+    """Every combination of the grid values."""
+    for values in itertools.product(*(grid[p] for p in PARAMETERS)):
+        yield dict(zip(PARAMETERS, values))
+
+def greedy_search(sweep, grid, p99_slo, max_points):
+    """Coordinate descent on cost per million requests subject to p99 <= p99_slo.
+
+    Starts from the first value of every parameter and moves to the cheapest
+    neighbour (one parameter one step along its list) that meets the SLO, until
+    no neighbour improves or max_points points have been run. Points violating
+    the SLO or missing data count as infinitely expensive.
+    """
+    def score(point):
+        values = summary_point(sweep.evaluate(point))
+        if values is None or values[1] > p99_slo:
+            return float('inf')
+        return values[0]
+
+    current = {p: grid[p][0] for p in PARAMETERS}
+    best = score(current)
+    while len(sweep.results) < max_points:
+        neighbours = []
+        for p in PARAMETERS:
+            i = grid[p].index(current[p])
+            for j in (i - 1, i + 1):
+                if 0 <= j < len(grid[p]):
+                    neighbours.append(dict(current, **{p: grid[p][j]}))
+        neighbours = [n for n in neighbours if point_id(n) not in sweep.results]
+        if not neighbours:
+            break
+        scored = []
+        for n in neighbours[:max_points - len(sweep.results)]:
+            scored.append((score(n), n))
+        cost, candidate = min(scored, key=lambda s: s[0])
+        if cost >= best:
+            break
+        best, current = cost, candidate
+    print(f"Greedy search finished at {point_id(current)} (USD/M req: {best})")
+
+def run_sweep(args):
+    grid, spec = load_grid(args.grid)
+    sweep = Sweep(args, spec)
+    os.makedirs(sweep.out_dir, exist_ok=True)
+    try:
+        if args.strategy == 'greedy':
+            p99_slo = args.p99_slo_ms if args.p99_slo_ms is not None else spec.get('p99_slo_ms', DEFAULT_P99_SLO_MS)
+            greedy_search(sweep, grid, float(p99_slo), args.max_points)
+        else:
+            for point in itertools.islice(grid_points(grid), args.max_points):
+                sweep.evaluate(point)
+    finally:
+        sweep.teardown()
+    summary_files = [os.path.join(sweep.out_dir, pid, 'summary_report.json') for pid in sweep.results]
+    write_pareto(summary_files, os.path.join(sweep.out_dir, 'pareto.json'))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sweep Cloud Run configurations and build the cost/p99 Pareto frontier.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sweep_parser = commands.add_parser('run', help='Run a sweep, then build the Pareto frontier')
+    sweep_parser.add_argument('grid', help='YAML file with a "grid" of parameter values')
+    sweep_parser.add_argument('--out', default='sweep_out', help='Directory for per-point results')
+    sweep_parser.add_argument('--strategy', choices=['grid', 'greedy'], default='grid',
+                              help='Run every combination, or search greedily for the cheapest '
+                                   'point meeting --p99-slo-ms')
+    sweep_parser.add_argument('--p99-slo-ms', type=float,
+                              help='p99 latency bound for the greedy search (overrides p99_slo_ms of '
+                                   f'the grid file; default {DEFAULT_P99_SLO_MS:g})')
+    sweep_parser.add_argument('--max-points', type=int, default=50,
+                              help='Stop after this many benchmarked points')
+    sweep_parser.add_argument('--run-id', help='Terraform run_id shared by all points (overrides run_id '
+                                               f'of the grid file; default {DEFAULT_RUN_ID})')
+    sweep_parser.add_argument('--pkb-dir', default=os.getenv('PKB_DIR', 'PerfKitBenchmarker'),
+                              help='PKB checkout with the wrk benchmark installed')
+    sweep_parser.add_argument('--traffic-profile', default='',
+                              help='Traffic profile YAML the monthly cost model projects (default: measured rate)')
+    sweep_parser.add_argument('--resume', action='store_true',
+                              help='Skip points whose summary_report.json already exists')
+    sweep_parser.add_argument('--keep', action='store_true',
+                              help='Keep the Terraform infrastructure after the sweep')
+
+    pareto_parser = commands.add_parser('pareto', help='Build the Pareto frontier from summary reports')
+    pareto_parser.add_argument('summaries', nargs='+', help='summary_report.json files')
+    pareto_parser.add_argument('--out', default='pareto.json', help='Output JSON file')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_sweep(args)
+    else:
+        write_pareto(args.summaries, args.out)
+
+if __name__ == '__main__':
+    main()
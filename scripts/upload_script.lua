@@ -1,7 +1,13 @@
 -- scripts/upload_script.lua
 -- Lua script for wrk to generate multipart/form-data POST requests.
 -- Reads 'sample.jpg' from the current directory on the client VM.
--- Includes done() function to print latency percentiles for PKB parsing.
+-- Includes done() function to print latency percentiles, the full latency
+-- histogram and a per-interval time series for PKB parsing.
+--
+-- WRK_BODY_POOL=N pre-builds N requests per thread in init(), each with its own
+-- boundary and filename (upload_<thread>_<n>.jpg), and request() cycles through
+-- them instead of assembling the multipart body on every call. Use it when the
+-- client CPU samples show the load generator saturating. [0 = build per request]
 
 local file_path = "sample.jpg" -- Relative path on the client VM
 local file_content
@@ -29,7 +35,129 @@ local function generate_boundary()
     return "---------------------------" .. string.format("%x", os.time()) .. string.format("%x", math.random(0, 0xFFFFFFFF))
 end
 
+-- **** Time series ****
+-- Per-interval completed requests, HTTP errors and latency percentiles, used to
+-- measure cold start and scale-out. Each request carries an X-Client-Sent
+-- timestamp that the app echoes back, which lets response() compute the
+-- latency of that exact request. Enable with WRK_TIMESERIES=1: parsing every
+-- response's headers in Lua costs client CPU, so it is off by default (the PKB
+-- config turns it on for the cost model and the summary report).
+local timeseries_enabled = os.getenv("WRK_TIMESERIES") == "1"
+local interval_sec = tonumber(os.getenv("WRK_TIMESERIES_INTERVAL") or "") or 1
+local interval_us = interval_sec * 1000000
+
+local ffi = require("ffi")
+ffi.cdef[[
+  typedef struct { long tv_sec; long tv_usec; } pkb_timeval;
+  int gettimeofday(pkb_timeval *tv, void *tz);
+]]
+local timeval = ffi.new("pkb_timeval")
+local function now_us()
+  ffi.C.gettimeofday(timeval, nil)
+  return tonumber(timeval.tv_sec) * 1000000 + tonumber(timeval.tv_usec)
+end
+
+-- latency_bucket() and print_latency_histogram(), shared with the other scripts
+for _, path in ipairs({"latency_histogram.lua", "scripts/latency_histogram.lua"}) do
+  local f = io.open(path, "r")
+  if f then
+    f:close()
+    dofile(path)
+    break
+  end
+end
+if not latency_bucket then
+  error("latency_histogram.lua not found in the working directory or scripts/")
+end
+
+-- Per-thread state, read by done() through thread:get(); keys are absolute interval numbers
+ts_first_sent = nil      -- us timestamp of this thread's first request
+ts_first_response = nil  -- us timestamp of this thread's first response
+ts_counts = {}
+ts_errors = {}
+ts_latency = {}          -- interval -> {latency bucket (us) -> count}
+
+local threads = {}
+setup = function(thread)
+  thread:set("thread_index", #threads)
+  table.insert(threads, thread)
+end
+
+if timeseries_enabled then
+  response = function(status, headers, body)
+    local now = now_us()
+    local slot = math.floor(now / interval_us)
+    if not ts_first_response then
+      ts_first_response = now
+    end
+    ts_counts[slot] = (ts_counts[slot] or 0) + 1
+    if status > 399 then -- Same rule as wrk's "Non-2xx or 3xx responses"
+      ts_errors[slot] = (ts_errors[slot] or 0) + 1
+    end
+    local sent = tonumber(headers["x-client-sent"] or headers["X-Client-Sent"] or "")
+    if sent then
+      local buckets = ts_latency[slot] or {}
+      local key = latency_bucket(now - sent)
+      buckets[key] = (buckets[key] or 0) + 1
+      ts_latency[slot] = buckets
+    end
+  end
+end
+
+-- **** Pre-built request pool ****
+local pool_size = tonumber(os.getenv("WRK_BODY_POOL") or "") or 0
+-- Stands in for the X-Client-Sent value; pooled requests are split around it
+local sent_placeholder = "PKB_CLIENT_SENT_PLACEHOLDER"
+local pool = {}  -- {head, tail}: the request is head .. timestamp .. tail
+local pool_next = 0
+thread_index = 0 -- Set per thread by setup()
+
+init = function(args)
+  if pool_size <= 0 then
+    return
+  end
+  math.randomseed(os.time() + thread_index)
+  for i = 1, pool_size do
+    local boundary = generate_boundary()
+    local filename = string.format("upload_%d_%d.jpg", thread_index, i)
+    local body = "--" .. boundary .. "\r\n" ..
+      "Content-Disposition: form-data; name=\"file\"; filename=\"" .. filename .. "\"\r\n" ..
+      "Content-Type: image/jpeg\r\n\r\n" ..
+      file_content .. "\r\n" ..
+      "--" .. boundary .. "--\r\n"
+    local headers = {}
+    for name, value in pairs(wrk.headers) do
+      headers[name] = value
+    end
+    headers["Content-Type"] = "multipart/form-data; boundary=" .. boundary
+    if timeseries_enabled then
+      headers["X-Client-Sent"] = sent_placeholder
+    end
+    local raw = wrk.format("POST", nil, headers, body)
+    local at = raw:find(sent_placeholder, 1, true)
+    if at then
+      pool[i] = {raw:sub(1, at - 1), raw:sub(at + #sent_placeholder)}
+    else
+      pool[i] = {raw, ""}
+    end
+  end
+end
+
 request = function()
+  if pool_size > 0 then
+    pool_next = pool_next % pool_size + 1
+    local entry = pool[pool_next]
+    if not timeseries_enabled then
+      return entry[1]
+    end
+    local now = now_us()
+    if not ts_first_sent then
+      ts_first_sent = now
+    end
+    -- One concatenation; the body itself is never rebuilt
+    return entry[1] .. string.format("%.0f", now) .. entry[2]
+  end
+
   local boundary = generate_boundary()
   local body = {}
 
@@ -43,6 +171,14 @@ request = function()
   wrk.headers["Content-Type"] = "multipart/form-data; boundary=" .. boundary
   -- wrk usually handles Content-Length correctly for POST bodies generated this way
 
+  if timeseries_enabled then
+    local now = now_us()
+    if not ts_first_sent then
+      ts_first_sent = now
+    end
+    wrk.headers["X-Client-Sent"] = string.format("%.0f", now)
+  end
+
   -- Path is usually part of the URL passed to wrk command line,
   -- so the path argument here is often nil or just "/".
   -- If your URL already includes /upload, use nil or "/".
@@ -50,6 +186,7 @@ request = function()
 end
 
 -- Optional: Log response status if needed for debugging specific errors
+-- (when the time series is enabled, add this to the response() defined above)
 -- response = function(status, headers, body)
 --   if status ~= 200 and status ~= 201 and status ~= 204 then -- Add expected success codes
 --     print(string.format("Non-Success Response: %d", status))
@@ -59,6 +196,72 @@ end
 --   end
 -- end
 
+-- Percentile (in ms) of a {latency bucket (us) -> count} table, or -1 if empty
+local function bucket_percentile(buckets, percentile)
+  local keys = {}
+  local total = 0
+  for key, count in pairs(buckets) do
+    table.insert(keys, key)
+    total = total + count
+  end
+  if total == 0 then
+    return -1
+  end
+  table.sort(keys)
+  local seen = 0
+  for _, key in ipairs(keys) do
+    seen = seen + buckets[key]
+    if seen >= total * percentile / 100.0 then
+      return key / 1000.0
+    end
+  end
+  return keys[#keys] / 1000.0
+end
+
+-- Merges the threads' time series and prints one line per interval:
+-- "offset_sec,requests,errors,p50_ms,p90_ms,p99_ms" (latency -1 when unknown)
+print_timeseries = function()
+  local first_sent, first_response
+  local counts, errors, latency = {}, {}, {}
+  for _, thread in ipairs(threads) do
+    local sent = thread:get("ts_first_sent")
+    local received = thread:get("ts_first_response")
+    if sent and (not first_sent or sent < first_sent) then first_sent = sent end
+    if received and (not first_response or received < first_response) then first_response = received end
+    for slot, count in pairs(thread:get("ts_counts") or {}) do
+      counts[slot] = (counts[slot] or 0) + count
+    end
+    for slot, count in pairs(thread:get("ts_errors") or {}) do
+      errors[slot] = (errors[slot] or 0) + count
+    end
+    for slot, buckets in pairs(thread:get("ts_latency") or {}) do
+      local merged = latency[slot] or {}
+      for key, count in pairs(buckets) do
+        merged[key] = (merged[key] or 0) + count
+      end
+      latency[slot] = merged
+    end
+  end
+  if not first_sent or not first_response then
+    return
+  end
+
+  -- Time from the very first request until any response arrived (cold start)
+  print(string.format("PKB_METRIC_First_Response_Latency: %.3f ms", (first_response - first_sent) / 1000.0))
+  print(string.format("PKB_METRIC_Timeseries_Interval: %d s", interval_sec))
+  local first_slot = math.floor(first_sent / interval_us)
+  local last_slot = first_slot
+  for slot, _ in pairs(counts) do
+    if slot > last_slot then last_slot = slot end
+  end
+  for slot = first_slot, last_slot do
+    local buckets = latency[slot] or {}
+    print(string.format("PKB_METRIC_Timeseries: %d,%d,%d,%.3f,%.3f,%.3f",
+      (slot - first_slot) * interval_sec, counts[slot] or 0, errors[slot] or 0,
+      bucket_percentile(buckets, 50), bucket_percentile(buckets, 90), bucket_percentile(buckets, 99)))
+  end
+end
+
 -- **** NEW PART: done() function ****
 -- This function executes *after* the benchmark finishes.
 -- wrk passes summary, latency, and requests objects.
@@ -81,10 +284,16 @@ done = function(summary, latency, requests)
   print(string.format("PKB_METRIC_Latency_p99: %.3f ms", p99_ms))
   print(string.format("PKB_METRIC_Latency_p999: %.3f ms", p999_ms))
 
+  print(string.format("PKB_METRIC_Latency_Mean: %.3f ms", latency.mean / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Stdev: %.3f ms", latency.stdev / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Min: %.3f ms", latency.min / 1000.0))
+  print(string.format("PKB_METRIC_Latency_Max: %.3f ms", latency.max / 1000.0))
+  print_latency_histogram(latency, summary.requests)
+  if timeseries_enabled then
+    print_timeseries()
+  end
+
   -- You can also print other stats from the summary or latency objects if needed
-  -- print(string.format("PKB_METRIC_Latency_Avg: %.3f ms", latency.mean / 1000.0))
-  -- print(string.format("PKB_METRIC_Latency_Stdev: %.3f ms", latency.stdev / 1000.0))
-  -- print(string.format("PKB_METRIC_Latency_Max: %.3f ms", latency.max / 1000.0))
   -- print(string.format("PKB_METRIC_Completed_Requests_Check: %d", summary.requests))
   -- print(string.format("PKB_METRIC_Total_Errors: %d", summary.errors.connect + summary.errors.read + summary.errors.write + summary.errors.timeout + summary.errors.status))
 